@@ -0,0 +1,239 @@
+import os
+from abc import ABC, abstractmethod
+from contextlib import AsyncExitStack
+from typing import Dict, Optional
+
+import asyncpg  # pip install asyncpg
+from motor.motor_asyncio import AsyncIOMotorClient  # pip install motor
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import aioboto3  # pip install aioboto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from urlshortener_idgen import normalize_url, url_digest
+
+# Async counterparts of the backends in urlshortener_multi_db.py.
+# They use the same tables/collections, so both servers can share one database.
+
+
+# Abstract Async Database Interface
+class AsyncURLStorageBackend(ABC):
+    async def connect(self):
+        """Open connections; called once before the server accepts traffic."""
+
+    async def close(self):
+        """Release connections on shutdown."""
+
+    @abstractmethod
+    async def store_url(self, short_id: str, long_url: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def get_url(self, short_id: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def url_exists(self, long_url: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def increment_clicks_bulk(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        """Add buffered click counts; returns the deltas that failed and should be retried."""
+        pass
+
+# Click updates for IDs that no longer exist are dropped, not retried
+PERMANENT_CLICK_ERRORS = ('ConditionalCheckFailedException', 'ValidationException')
+
+# PostgreSQL Implementation
+class AsyncPostgreSQLBackend(AsyncURLStorageBackend):
+    async def connect(self):
+        self.pool = await asyncpg.create_pool(
+            database=os.getenv('PG_DATABASE', 'urlshortener'),
+            user=os.getenv('PG_USER', 'postgres'),
+            password=os.getenv('PG_PASSWORD', 'postgres'),
+            host=os.getenv('PG_HOST', 'localhost'),
+            min_size=int(os.getenv('PG_POOL_MIN', 2)),
+            max_size=int(os.getenv('PG_POOL_MAX', 20))
+        )
+        await self.pool.execute("""
+            CREATE TABLE IF NOT EXISTS url_mappings (
+                short_id VARCHAR(50) PRIMARY KEY,
+                long_url TEXT NOT NULL,
+                long_url_digest CHAR(64),
+                clicks BIGINT NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await self.pool.execute("ALTER TABLE url_mappings ADD COLUMN IF NOT EXISTS long_url_digest CHAR(64)")
+        await self.pool.execute("ALTER TABLE url_mappings ADD COLUMN IF NOT EXISTS clicks BIGINT NOT NULL DEFAULT 0")
+        await self.pool.execute("""
+            CREATE INDEX IF NOT EXISTS url_mappings_digest_idx
+            ON url_mappings (long_url_digest)
+        """)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def store_url(self, short_id: str, long_url: str) -> bool:
+        try:
+            await self.pool.execute(
+                "INSERT INTO url_mappings (short_id, long_url, long_url_digest) VALUES ($1, $2, $3)",
+                short_id, long_url, url_digest(long_url)
+            )
+            return True
+        except Exception:
+            return False
+
+    async def get_url(self, short_id: str) -> Optional[str]:
+        return await self.pool.fetchval("SELECT long_url FROM url_mappings WHERE short_id = $1", short_id)
+
+    async def url_exists(self, long_url: str) -> Optional[str]:
+        normalized = normalize_url(long_url)
+        rows = await self.pool.fetch(
+            "SELECT short_id, long_url FROM url_mappings WHERE long_url_digest = $1", url_digest(long_url)
+        )
+        for row in rows:
+            if normalize_url(row['long_url']) == normalized:
+                return row['short_id']
+        return None
+
+    async def increment_clicks_bulk(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        # One statement, so it either applies every delta or raises and all are retried
+        await self.pool.execute("""
+            UPDATE url_mappings AS m SET clicks = m.clicks + v.delta
+            FROM unnest($1::text[], $2::bigint[]) AS v (short_id, delta)
+            WHERE m.short_id = v.short_id
+        """, list(deltas.keys()), list(deltas.values()))
+        return {}
+
+# MongoDB Implementation
+class AsyncMongoDBBackend(AsyncURLStorageBackend):
+    async def connect(self):
+        self.client = AsyncIOMotorClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+        self.db = self.client.urlshortener
+        self.collection = self.db.url_mappings
+        await self.collection.create_index('short_id', unique=True)
+        await self.collection.create_index('long_url_digest')
+
+    async def close(self):
+        self.client.close()
+
+    async def store_url(self, short_id: str, long_url: str) -> bool:
+        try:
+            await self.collection.insert_one({
+                'short_id': short_id,
+                'long_url': long_url,
+                'long_url_digest': url_digest(long_url)
+            })
+            return True
+        except Exception:
+            return False
+
+    async def get_url(self, short_id: str) -> Optional[str]:
+        result = await self.collection.find_one({'short_id': short_id})
+        return result['long_url'] if result else None
+
+    async def url_exists(self, long_url: str) -> Optional[str]:
+        normalized = normalize_url(long_url)
+        candidates = self.collection.find(
+            {'long_url_digest': url_digest(long_url)}, {'short_id': 1, 'long_url': 1, '_id': 0}
+        )
+        async for doc in candidates:
+            if normalize_url(doc['long_url']) == normalized:
+                return doc['short_id']
+        return None
+
+    async def increment_clicks_bulk(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        items = list(deltas.items())
+        try:
+            await self.collection.bulk_write(
+                [UpdateOne({'short_id': short_id}, {'$inc': {'clicks': count}}) for short_id, count in items],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            # Unordered, so every update without a write error was applied
+            return {items[error['index']][0]: items[error['index']][1] for error in e.details.get('writeErrors', [])}
+        return {}
+
+# DynamoDB Implementation
+class AsyncDynamoDBBackend(AsyncURLStorageBackend):
+    async def connect(self):
+        self._stack = AsyncExitStack()
+        self.dynamodb = await self._stack.enter_async_context(aioboto3.Session().resource('dynamodb'))
+        self.table = await self.dynamodb.Table('url_mappings')
+
+    async def close(self):
+        await self._stack.aclose()
+
+    async def store_url(self, short_id: str, long_url: str) -> bool:
+        try:
+            await self.table.put_item(
+                Item={
+                    'short_id': short_id,
+                    'long_url': long_url,
+                    'long_url_digest': url_digest(long_url)
+                },
+                ConditionExpression='attribute_not_exists(short_id)'
+            )
+            return True
+        except Exception:
+            return False
+
+    async def get_url(self, short_id: str) -> Optional[str]:
+        try:
+            response = await self.table.get_item(Key={'short_id': short_id})
+            return response['Item']['long_url'] if 'Item' in response else None
+        except ClientError:
+            return None
+
+    async def url_exists(self, long_url: str) -> Optional[str]:
+        try:
+            normalized = normalize_url(long_url)
+            # Table and GSI are provisioned by DynamoDBBackend in urlshortener_multi_db.py
+            response = await self.table.query(
+                IndexName='long_url_digest_index',
+                KeyConditionExpression=Key('long_url_digest').eq(url_digest(long_url))
+            )
+            for item in response.get('Items', []):
+                if normalize_url(item['long_url']) == normalized:
+                    return item['short_id']
+            return None
+        except ClientError:
+            return None
+
+    async def increment_clicks_bulk(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        # No batch update in DynamoDB: one ADD per short ID per flush
+        failed = {}
+        items = list(deltas.items())
+        for i, (short_id, count) in enumerate(items):
+            try:
+                await self.table.update_item(
+                    Key={'short_id': short_id},
+                    UpdateExpression='ADD clicks :inc',
+                    ConditionExpression='attribute_exists(short_id)',
+                    ExpressionAttributeValues={':inc': count}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] in PERMANENT_CLICK_ERRORS:
+                    print("Dropping clicks for", short_id, ":", e)
+                else:
+                    failed[short_id] = count
+            except Exception as e:
+                # Connection-level failure: keep this and every remaining delta
+                print("Error flushing clicks:", e)
+                failed.update(items[i:])
+                break
+        return failed
+
+# Database factory
+async def get_async_storage_backend() -> AsyncURLStorageBackend:
+    backend_type = os.getenv('STORAGE_BACKEND', 'postgresql')
+    backends = {
+        'postgresql': AsyncPostgreSQLBackend,
+        'mongodb': AsyncMongoDBBackend,
+        'dynamodb': AsyncDynamoDBBackend
+    }
+    backend = backends[backend_type]()
+    await backend.connect()
+    return backend
@@ -0,0 +1,130 @@
+import mmap
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+from urlshortener_idgen import SHORT_ID_LENGTH, base62_decode
+from urlshortener_postgresql import connect_to_db
+
+# One shard per leading base62 character, each covering 62^6 IDs
+SHARD_COUNT = 62
+SHARD_BITS = 62 ** (SHORT_ID_LENGTH - 1)
+SHARD_BYTES = (SHARD_BITS + 7) // 8  # ~7.1 GB apparent size per shard
+
+
+class KeySpaceBitmap:
+    """Memory-mapped occupancy bitmap over the 62^7 short ID space.
+
+    Each shard is a sparse file, so the filesystem only allocates the pages
+    that actually hold set bits. Lookups are a single byte read from the
+    mapped file and never touch the database.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def _shard_file(self, shard: int) -> str:
+        return os.path.join(self.path, f"shard_{shard:02d}.bin")
+
+    def _shard(self, shard: int, create: bool) -> Optional[mmap.mmap]:
+        mapped = self._shards.get(shard)
+        if mapped is not None:
+            return mapped
+        with self._lock:
+            if shard in self._shards:
+                return self._shards[shard]
+            filename = self._shard_file(shard)
+            if not create and not os.path.exists(filename):
+                return None
+            fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size < SHARD_BYTES:
+                    os.ftruncate(fd, SHARD_BYTES)  # Extends as a sparse file
+                mapped = mmap.mmap(fd, SHARD_BYTES)
+            finally:
+                os.close(fd)
+            self._shards[shard] = mapped
+            return mapped
+
+    def _locate(self, short_id: str):
+        shard, offset = divmod(base62_decode(short_id), SHARD_BITS)
+        return shard, offset >> 3, 1 << (offset & 7)
+
+    def add(self, short_id: str) -> bool:
+        """Mark a short ID as taken. Returns False if it was already set."""
+        shard, index, mask = self._locate(short_id)
+        mapped = self._shard(shard, create=True)
+        with self._lock:
+            current = mapped[index]
+            if current & mask:
+                return False
+            mapped[index] = current | mask
+            return True
+
+    def __contains__(self, short_id: str) -> bool:
+        shard, index, mask = self._locate(short_id)
+        mapped = self._shard(shard, create=False)
+        return mapped is not None and bool(mapped[index] & mask)
+
+    def update(self, short_ids: Iterable[str]) -> int:
+        return sum(1 for short_id in short_ids if self.add(short_id))
+
+    def flush(self):
+        for mapped in self._shards.values():
+            mapped.flush()
+
+    def close(self):
+        with self._lock:
+            for mapped in self._shards.values():
+                mapped.flush()
+                mapped.close()
+            self._shards.clear()
+
+    def clear(self):
+        """Drop all shards so the bitmap can be rebuilt from scratch."""
+        self.close()
+        for shard in range(SHARD_COUNT):
+            filename = self._shard_file(shard)
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+def rebuild_from_postgres(conn, bitmap: KeySpaceBitmap, batch_size: int = 100000) -> int:
+    """Stream every short_url in the urls table into a fresh bitmap."""
+    bitmap.clear()
+    count = 0
+    start = time.perf_counter()
+    # A named cursor is server-side, so rows are fetched in batches instead of all at once
+    with conn.cursor(name="bitmap_rebuild") as cur:
+        cur.itersize = batch_size
+        cur.execute("SELECT short_url FROM urls;")
+        for (short_url,) in cur:
+            bitmap.add(short_url.strip())  # Remove padding from CHAR(7)
+            count += 1
+            if count % batch_size == 0:
+                print(f"Loaded {count} keys ({count / (time.perf_counter() - start):,.0f} keys/s)")
+    conn.commit()
+    bitmap.flush()
+    print(f"Rebuilt bitmap with {count} keys in {time.perf_counter() - start:.1f}s")
+    return count
+
+
+# Rebuild tool
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the key-space bitmap from PostgreSQL")
+    parser.add_argument("--path", default=os.getenv("KEY_BITMAP_PATH", "keyspace_bitmap"))
+    parser.add_argument("--batch-size", type=int, default=100000)
+    args = parser.parse_args()
+
+    conn = connect_to_db()
+    if conn:
+        bitmap = KeySpaceBitmap(args.path)
+        rebuild_from_postgres(conn, bitmap, args.batch_size)
+        bitmap.close()
+        conn.close()
@@ -0,0 +1,278 @@
+import hashlib
+import math
+import threading
+import time
+import uuid
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from urlshortener_cache import LocalCache
+
+
+def bloom_size(capacity: int, error_rate: float) -> Tuple[int, int]:
+    """(number of slots, number of hash functions) for capacity items at error_rate."""
+    size = max(1, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    return size, max(1, round(size / capacity * math.log(2)))
+
+
+def bloom_indexes(item: str, size: int, hash_count: int) -> List[int]:
+    digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'big')
+    h2 = int.from_bytes(digest[8:], 'big') | 1
+    return [(h1 + i * h2) % size for i in range(hash_count)]
+
+
+class BloomFilter:
+    """In-process Bloom filter over a bit array.
+
+    Memory is about 9.6 bits per item at a 1% error rate (12 MB for 10M).
+    Items can't be removed; a deleted short ID stays a false positive until
+    the next rebuild.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size, self.hash_count = bloom_size(capacity, error_rate)
+        self.bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _indexes(self, item: str):
+        return bloom_indexes(item, self.size, self.hash_count)
+
+    def add(self, item: str):
+        with self._lock:
+            for index in self._indexes(item):
+                self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[index >> 3] >> (index & 7) & 1 for index in self._indexes(item))
+
+
+class RedisBloomFilter:
+    """Plain Bloom filter kept in a Redis bitmap and shared by every worker.
+
+    Bits are read and written with one BITFIELD call per item. rebuild()
+    fills a temporary bitmap and renames it over the live one; adds made in
+    the meantime go to both, so none are lost. A SET NX lock lets only one
+    worker rebuild at a time. The bitmap is about 9.6 bits per item at a 1%
+    error rate (12 MB for 10M), held once in Redis instead of per process.
+
+    record_miss() keeps a short-lived key per false positive the database
+    confirmed missing, so every worker skips it; add() deletes that key in
+    the same round trip, so a new ID is never reported missing.
+    """
+
+    ADD_SCRIPT = """
+    redis.call('BITFIELD', KEYS[1], unpack(ARGV))
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        redis.call('BITFIELD', KEYS[2], unpack(ARGV))
+    end
+    return 1
+    """
+
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, redis_client, capacity: int, error_rate: float = 0.01,
+                 key: str = "short_id_filter", lock_ttl: int = 3600):
+        self.redis = redis_client
+        self.size, self.hash_count = bloom_size(capacity, error_rate)
+        # Hash tag keeps every key in one cluster slot for the scripts
+        self.key = f"{{{key}}}:bits"
+        self.rebuild_key = f"{{{key}}}:rebuilding"
+        self.built_at_key = f"{{{key}}}:built_at"
+        self.lock_key = f"{{{key}}}:lock"
+        # Not hash-tagged: miss keys spread over the cluster and no script touches them
+        self.miss_prefix = f"{key}:miss:"
+        self.lock_ttl = lock_ttl
+        self._add = redis_client.register_script(self.ADD_SCRIPT)
+        self._release = redis_client.register_script(self.RELEASE_SCRIPT)
+
+    def _args(self, op: str, item: str) -> List:
+        args = []
+        for index in bloom_indexes(item, self.size, self.hash_count):
+            args += [op, 'u1', index] + ([1] if op == 'SET' else [])
+        return args
+
+    def add(self, item: str):
+        pipe = self.redis.pipeline(transaction=False)
+        self._add(keys=[self.key, self.rebuild_key], args=self._args('SET', item), client=pipe)
+        pipe.delete(f"{self.miss_prefix}{item}")
+        pipe.execute()
+
+    def record_miss(self, item: str, ttl: float):
+        self.redis.set(f"{self.miss_prefix}{item}", 1, px=max(1, int(ttl * 1000)))
+
+    def might_contain(self, item: str) -> Optional[bool]:
+        """Membership, or None if no rebuild has completed yet; recorded misses read as False."""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.exists(self.built_at_key)
+        pipe.execute_command('BITFIELD', self.key, *self._args('GET', item))
+        pipe.exists(f"{self.miss_prefix}{item}")
+        built, bits, missed = pipe.execute()
+        if missed:
+            return False
+        if not built:
+            return None
+        return all(bits)
+
+    def age(self) -> Optional[float]:
+        """Seconds since the last completed rebuild, or None if there was none."""
+        built_at = self.redis.get(self.built_at_key)
+        return time.time() - float(built_at) if built_at else None
+
+    def rebuild(self, items: Iterable[str], batch_size: int = 10000) -> Optional[int]:
+        """Rebuild from items and swap in; None if another worker holds the rebuild lock."""
+        token = uuid.uuid4().hex
+        if not self.redis.set(self.lock_key, token, nx=True, ex=self.lock_ttl):
+            return None
+        try:
+            self.redis.delete(self.rebuild_key)
+            # Create the full-size bitmap up front so concurrent adds see it
+            self.redis.setbit(self.rebuild_key, self.size - 1, 0)
+            count = 0
+            pipe = self.redis.pipeline(transaction=False)
+            for item in items:
+                pipe.execute_command('BITFIELD', self.rebuild_key, *self._args('SET', item))
+                count += 1
+                if count % batch_size == 0:
+                    pipe.execute()
+            pipe.execute()
+            self.redis.rename(self.rebuild_key, self.key)
+            self.redis.set(self.built_at_key, time.time())
+            return count
+        except Exception:
+            self.redis.delete(self.rebuild_key)
+            raise
+        finally:
+            self._release(keys=[self.lock_key], args=[token])
+
+
+class ShortIdFilter:
+    """Membership filter of issued short IDs with a negative-result cache.
+
+    might_exist() returning False is a definite miss, so the caller can answer
+    404 without a database query. Bloom false positives that the database
+    confirms missing are remembered in a short-lived negative cache, and
+    add() clears an ID's entry. Until the first rebuild completes every ID is
+    treated as possibly existing. Deleted IDs stay in the filter until the
+    next rebuild; their lookups fall through to the database and the
+    negative cache.
+
+    With a redis_client the filter and the negative cache live in Redis
+    (RedisBloomFilter), so IDs created by any worker are visible to all of
+    them. Without one both are per process and only see this process's adds
+    between rebuilds, so another worker's new ID can 404 here for up to
+    negative_ttl. That is only correct with a single worker; the filter costs
+    about 12 MB per 10M capacity, twice that while rebuilding.
+    """
+
+    def __init__(self, capacity: int = 10_000_000, error_rate: float = 0.01,
+                 negative_ttl: float = 30.0, negative_max_entries: int = 100000,
+                 redis_client=None, redis_key: str = "short_id_filter"):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.negative_ttl = negative_ttl
+        if redis_client is not None:
+            self.shared = RedisBloomFilter(redis_client, capacity, error_rate, key=redis_key)
+            self.bloom = None
+            self.negative_cache = None
+        else:
+            self.shared = None
+            self.bloom = BloomFilter(capacity, error_rate)
+            self.negative_cache = LocalCache(max_entries=negative_max_entries, ttl=negative_ttl)
+        self.ready = False
+        self._rebuilding: Optional[BloomFilter] = None
+        self._lock = threading.Lock()
+
+    def add(self, short_id: str):
+        if self.shared is not None:
+            try:
+                self.shared.add(short_id)
+            except Exception as e:
+                print("Error adding to short ID filter:", e)
+            return
+        with self._lock:
+            self.bloom.add(short_id)
+            if self._rebuilding is not None:
+                self._rebuilding.add(short_id)
+        self.negative_cache.delete(short_id)
+
+    def might_exist(self, short_id: str) -> bool:
+        if self.shared is not None:
+            try:
+                if self.shared.might_contain(short_id) is False:
+                    return False
+            except Exception as e:
+                # Fail open: the database decides
+                print("Error checking short ID filter:", e)
+            return True
+        if self.ready and short_id not in self.bloom:
+            return False
+        return self.negative_cache.get(short_id) is None
+
+    def record_miss(self, short_id: str):
+        """Remember that the backend does not have short_id."""
+        if self.shared is None:
+            self.negative_cache.set(short_id, "1")
+            return
+        try:
+            self.shared.record_miss(short_id, self.negative_ttl)
+        except Exception as e:
+            print("Error recording short ID miss:", e)
+
+    def rebuild(self, short_ids: Iterable[str]) -> int:
+        """Build a fresh filter from the backend's IDs and swap it in."""
+        if self.shared is not None:
+            try:
+                count = self.shared.rebuild(short_ids)
+            except Exception as e:
+                print("Error rebuilding short ID filter:", e)
+                return 0
+            if count is not None:
+                print(f"Short ID filter rebuilt with {count} IDs")
+            return count or 0
+        new_bloom = BloomFilter(self.capacity, self.error_rate)
+        with self._lock:
+            self._rebuilding = new_bloom
+        count = 0
+        try:
+            for short_id in short_ids:
+                new_bloom.add(short_id)
+                count += 1
+        except Exception as e:
+            print("Error rebuilding short ID filter:", e)
+            with self._lock:
+                self._rebuilding = None
+            return count
+        with self._lock:
+            self.bloom = new_bloom
+            self._rebuilding = None
+            self.ready = True
+        print(f"Short ID filter rebuilt with {count} IDs")
+        return count
+
+    def _rebuild_loop(self, load_short_ids: Callable[[], Iterable[str]], interval: Optional[float]):
+        while True:
+            # A shared filter another worker rebuilt recently is left alone
+            try:
+                age = self.shared.age() if self.shared is not None else None
+            except Exception as e:
+                print("Error checking short ID filter age:", e)
+                age = None
+            if age is None or interval is None or age >= interval:
+                self.rebuild(load_short_ids())
+            if interval is None:
+                return
+            time.sleep(interval)
+
+    def rebuild_in_background(self, load_short_ids: Callable[[], Iterable[str]],
+                              interval: Optional[float] = None) -> threading.Thread:
+        """Rebuild now, then every interval seconds if one is given."""
+        thread = threading.Thread(target=self._rebuild_loop, args=(load_short_ids, interval),
+                                  name="short-id-filter-rebuild", daemon=True)
+        thread.start()
+        return thread
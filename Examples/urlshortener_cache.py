@@ -0,0 +1,439 @@
+import asyncio
+import math
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from urlshortener_idgen import url_digest
+
+TTL = Union[int, timedelta]
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with per-entry TTL.
+
+    Entries are evicted least-recently-used first once either max_entries or
+    max_bytes is exceeded; sizes are the in-memory sizes of key and value.
+    Hit, miss and eviction counts are kept for monitoring.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        size = sys.getsizeof(key) + sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class BackgroundRefresher:
+    """Refreshes hot cache entries before they expire (XFetch).
+
+    A read that finds remaining seconds left on an entry triggers a refresh
+    with probability exp(-remaining / (delta * beta)), where delta is a
+    moving average of how long load takes plus any extra lead the caller
+    passes. Hot keys are read many times near expiry, so one of those reads
+    almost surely refreshes them; cold keys are left to expire. beta > 1
+    refreshes earlier. load(key) runs on a small thread pool, at most once in
+    flight per key, and is expected to write the fresh value to the cache.
+    """
+
+    def __init__(self, load: Callable[[str], Any], beta: float = 1.0, max_workers: int = 2,
+                 max_pending: int = 1000):
+        self.load = load
+        self.beta = beta
+        self.max_pending = max_pending
+        self.delta = 0.05  # seconds; updated from observed load times
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cache-refresh")
+        self.refreshes = 0
+        self.dropped = 0
+
+    def should_refresh(self, remaining: float, lead: float = 0.0) -> bool:
+        # 1 - random() is in (0, 1], so the log is finite
+        return remaining <= -(self.delta + lead) * self.beta * math.log(1.0 - random.random())
+
+    def _claim(self, key: str) -> bool:
+        with self._lock:
+            if key in self._pending:
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.add(key)
+            return True
+
+    def _finish(self, key: str, elapsed: float):
+        with self._lock:
+            self._pending.discard(key)
+            self.delta = 0.8 * self.delta + 0.2 * elapsed
+            self.refreshes += 1
+
+    def submit(self, key: str):
+        if self._claim(key):
+            self._executor.submit(self._run, key)
+
+    def _run(self, key: str):
+        start = time.monotonic()
+        try:
+            self.load(key)
+        except Exception as e:
+            print("Error refreshing cache entry:", e)
+        finally:
+            self._finish(key, time.monotonic() - start)
+
+
+class AsyncBackgroundRefresher(BackgroundRefresher):
+    """BackgroundRefresher for async loaders; refreshes run as event loop tasks."""
+
+    def __init__(self, load: Callable[[str], Awaitable[Any]], beta: float = 1.0, max_pending: int = 1000):
+        self.load = load
+        self.beta = beta
+        self.max_pending = max_pending
+        self.delta = 0.05
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._tasks = set()  # strong references until the tasks finish
+        self.refreshes = 0
+        self.dropped = 0
+
+    def submit(self, key: str):
+        if self._claim(key):
+            task = asyncio.get_running_loop().create_task(self._run(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: str):
+        start = time.monotonic()
+        try:
+            await self.load(key)
+        except Exception as e:
+            print("Error refreshing cache entry:", e)
+        finally:
+            self._finish(key, time.monotonic() - start)
+
+
+class URLCache:
+    """Redis cache for short_id <-> long_url mappings.
+
+    Writes for both directions of a mapping go out in one pipelined round
+    trip (wrapped in MULTI/EXEC when transactional=True) instead of one
+    SETEX each. An optional LocalCache sits in front of the short_id lookups
+    so hot links resolve without a network hop. With digest_long_keys=True the
+    reverse keys hold a fixed-size digest of the normalized long URL instead
+    of the URL itself.
+
+    Each key's TTL is stretched or shrunk by up to ttl_jitter (a fraction),
+    so entries written in the same burst don't all expire together. With a
+    refresher attached, short_id reads also fetch the remaining TTL in the
+    same round trip and hand keys close to expiry to it. Writes take an
+    optional max_ttl (seconds) so mappings that expire in the backend don't
+    outlive it in the cache.
+    """
+
+    def __init__(self, redis_client, long_prefix: str = "long_url:", short_prefix: str = "short_url:",
+                 ttl: TTL = timedelta(days=7), transactional: bool = False,
+                 local_cache: Optional[LocalCache] = None, digest_long_keys: bool = False,
+                 ttl_jitter: float = 0.0, refresher: Optional[BackgroundRefresher] = None):
+        self.redis = redis_client
+        self.long_prefix = long_prefix
+        self.short_prefix = short_prefix
+        self.ttl = ttl
+        self.transactional = transactional
+        self.local_cache = local_cache
+        self.digest_long_keys = digest_long_keys
+        self.ttl_jitter = ttl_jitter
+        self.refresher = refresher
+
+    def _jittered_ttl(self, ttl: TTL, max_ttl: Optional[float] = None) -> int:
+        seconds = ttl.total_seconds() if isinstance(ttl, timedelta) else ttl
+        if self.ttl_jitter:
+            seconds *= 1 + random.uniform(-self.ttl_jitter, self.ttl_jitter)
+        if max_ttl is not None:
+            seconds = min(seconds, max_ttl)
+        return max(1, int(seconds))
+
+    def _check_refresh(self, short_id: str, pttl: int):
+        # Keys served from L1 are only re-read from Redis once per L1 TTL, so
+        # the refresh window has to reach back that far as well
+        if pttl > 0:
+            lead = self.local_cache.ttl if self.local_cache is not None else 0.0
+            if self.refresher.should_refresh(pttl / 1000, lead):
+                self.refresher.submit(short_id)
+
+    def _long_key(self, long_url: str) -> str:
+        if self.digest_long_keys:
+            return f"{self.long_prefix}{url_digest(long_url)}"
+        return f"{self.long_prefix}{long_url}"
+
+    def _get_local(self, short_id: str) -> Optional[str]:
+        if self.local_cache is None:
+            return None
+        return self.local_cache.get(short_id)
+
+    def _set_local(self, short_id: str, long_url: str, max_ttl: Optional[float] = None):
+        if self.local_cache is not None:
+            ttl = min(self.local_cache.ttl, max_ttl) if max_ttl is not None else None
+            self.local_cache.set(short_id, long_url, ttl)
+
+    def _drop_local(self, short_id: str, long_url: Optional[str]) -> List[str]:
+        """Drop short_id from L1; returns the Redis keys of the mapping."""
+        if self.local_cache is not None:
+            self.local_cache.delete(short_id)
+        keys = [f"{self.short_prefix}{short_id}"]
+        if long_url is not None:
+            keys.append(self._long_key(long_url))
+        return keys
+
+    def get_long_url(self, short_id: str) -> Optional[str]:
+        long_url = self._get_local(short_id)
+        if long_url is None:
+            key = f"{self.short_prefix}{short_id}"
+            if self.refresher is None:
+                long_url = self.redis.get(key)
+            else:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.get(key)
+                pipe.pttl(key)
+                long_url, pttl = pipe.execute()
+                if long_url:
+                    self._check_refresh(short_id, pttl)
+            if long_url:
+                self._set_local(short_id, long_url)
+        return long_url
+
+    def get_short_id(self, long_url: str) -> Optional[str]:
+        return self.redis.get(self._long_key(long_url))
+
+    def get_long_urls(self, short_ids: List[str]) -> List[Optional[str]]:
+        """L1 first, then one MGET for the rest; results are in input order."""
+        results = [self._get_local(short_id) for short_id in short_ids]
+        missing = [i for i, long_url in enumerate(results) if long_url is None]
+        fetched = self.get_many([f"{self.short_prefix}{short_ids[i]}" for i in missing])
+        for i, long_url in zip(missing, fetched):
+            if long_url:
+                results[i] = long_url
+                self._set_local(short_ids[i], long_url)
+        return results
+
+    def get_short_ids(self, long_urls: List[str]) -> List[Optional[str]]:
+        return self.get_many([self._long_key(long_url) for long_url in long_urls])
+
+    def set_mapping(self, short_id: str, long_url: str, max_ttl: Optional[float] = None):
+        self.set_mappings([(short_id, long_url)], max_ttl)
+
+    def set_mappings(self, mappings: Iterable[Tuple[str, str]], max_ttl: Optional[float] = None):
+        """Cache both directions of each (short_id, long_url) pair in one round trip."""
+        items = {}
+        for short_id, long_url in mappings:
+            items[f"{self.short_prefix}{short_id}"] = long_url
+            items[self._long_key(long_url)] = short_id
+            self._set_local(short_id, long_url, max_ttl)
+        self.set_many(items, max_ttl=max_ttl)
+
+    def delete_mapping(self, short_id: str, long_url: Optional[str] = None):
+        """Drop a mapping from Redis and this process's L1 (other workers' L1 entries age out)."""
+        self.redis.delete(*self._drop_local(short_id, long_url))
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Fetch raw keys with a single MGET; results are in input order."""
+        if not keys:
+            return []
+        return self.redis.mget(keys)
+
+    def set_many(self, items: Dict[str, str], ttl: Optional[TTL] = None, max_ttl: Optional[float] = None):
+        """SETEX every key in one pipelined round trip."""
+        if not items:
+            return
+        ttl = ttl if ttl is not None else self.ttl
+        pipe = self.redis.pipeline(transaction=self.transactional)
+        for key, value in items.items():
+            pipe.setex(key, self._jittered_ttl(ttl, max_ttl), value)
+        pipe.execute()
+
+
+def warm_cache(url_cache: URLCache, mappings: Iterable[Tuple[str, str]], batch_size: int = 1000,
+               budget: Optional[float] = None, total: Optional[int] = None) -> int:
+    """Load (short_id, long_url) pairs into the cache, one pipelined batch at a time.
+
+    mappings is consumed lazily, so it can stream from a database cursor.
+    Loading stops once budget seconds have passed, if given; the budget is
+    checked after every mapping, so bound the source's own wait as well
+    (e.g. a cursor time limit). If the source raises, what was read so far is
+    still cached. Progress is printed after every batch (out of total, if
+    known). Returns the number of mappings loaded.
+    """
+    start = time.monotonic()
+    deadline = start + budget if budget is not None else None
+    loaded = 0
+    batch = []
+    try:
+        for mapping in mappings:
+            batch.append(mapping)
+            if len(batch) >= batch_size:
+                url_cache.set_mappings(batch)
+                loaded += len(batch)
+                batch = []
+                print(f"Cache warm-up: {loaded}{f'/{total}' if total else ''} URLs "
+                      f"in {time.monotonic() - start:.1f}s")
+            if deadline is not None and time.monotonic() >= deadline:
+                print("Cache warm-up budget exhausted")
+                break
+    except Exception as e:
+        print("Error reading cache warm-up mappings:", e)
+    if batch:
+        url_cache.set_mappings(batch)
+        loaded += len(batch)
+    print(f"Cache warm-up done: {loaded} URLs in {time.monotonic() - start:.1f}s")
+    return loaded
+
+
+def resolve_many(url_cache: URLCache, short_ids: List[str],
+                 fetch_many: Callable[[List[str]], List[Optional[str]]],
+                 short_id_filter=None, backfill: bool = True) -> List[Optional[str]]:
+    """Expand many short IDs: one cache multi-get, one backend multi-get, one backfill pipeline.
+
+    fetch_many is the backend batch lookup, called only for cache misses that
+    short_id_filter (a ShortIdFilter, if given) can't rule out. Pass
+    backfill=False when fetch_many caches what it finds itself. Results are
+    in input order, with None for unknown IDs.
+    """
+    unique_ids = list(dict.fromkeys(short_ids))
+    found = dict(zip(unique_ids, url_cache.get_long_urls(unique_ids)))
+    misses = [
+        short_id for short_id, long_url in found.items()
+        if not long_url and (short_id_filter is None or short_id_filter.might_exist(short_id))
+    ]
+    fetched = []
+    if misses:
+        for short_id, long_url in zip(misses, fetch_many(misses)):
+            if long_url:
+                found[short_id] = long_url
+                fetched.append((short_id, long_url))
+            elif short_id_filter is not None:
+                short_id_filter.record_miss(short_id)
+    if backfill:
+        url_cache.set_mappings(fetched)
+    return [found.get(short_id) or None for short_id in short_ids]
+
+
+class AsyncURLCache(URLCache):
+    """URLCache for redis.asyncio clients; same API, awaitable."""
+
+    async def get_long_url(self, short_id: str) -> Optional[str]:
+        long_url = self._get_local(short_id)
+        if long_url is None:
+            key = f"{self.short_prefix}{short_id}"
+            if self.refresher is None:
+                long_url = await self.redis.get(key)
+            else:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.get(key)
+                    pipe.pttl(key)
+                    long_url, pttl = await pipe.execute()
+                if long_url:
+                    self._check_refresh(short_id, pttl)
+            if long_url:
+                self._set_local(short_id, long_url)
+        return long_url
+
+    async def get_short_id(self, long_url: str) -> Optional[str]:
+        return await self.redis.get(self._long_key(long_url))
+
+    async def get_long_urls(self, short_ids: List[str]) -> List[Optional[str]]:
+        results = [self._get_local(short_id) for short_id in short_ids]
+        missing = [i for i, long_url in enumerate(results) if long_url is None]
+        fetched = await self.get_many([f"{self.short_prefix}{short_ids[i]}" for i in missing])
+        for i, long_url in zip(missing, fetched):
+            if long_url:
+                results[i] = long_url
+                self._set_local(short_ids[i], long_url)
+        return results
+
+    async def get_short_ids(self, long_urls: List[str]) -> List[Optional[str]]:
+        return await self.get_many([self._long_key(long_url) for long_url in long_urls])
+
+    async def set_mapping(self, short_id: str, long_url: str, max_ttl: Optional[float] = None):
+        await self.set_mappings([(short_id, long_url)], max_ttl)
+
+    async def set_mappings(self, mappings: Iterable[Tuple[str, str]], max_ttl: Optional[float] = None):
+        items = {}
+        for short_id, long_url in mappings:
+            items[f"{self.short_prefix}{short_id}"] = long_url
+            items[self._long_key(long_url)] = short_id
+            self._set_local(short_id, long_url, max_ttl)
+        await self.set_many(items, max_ttl=max_ttl)
+
+    async def delete_mapping(self, short_id: str, long_url: Optional[str] = None):
+        await self.redis.delete(*self._drop_local(short_id, long_url))
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return await self.redis.mget(keys)
+
+    async def set_many(self, items: Dict[str, str], ttl: Optional[TTL] = None, max_ttl: Optional[float] = None):
+        if not items:
+            return
+        ttl = ttl if ttl is not None else self.ttl
+        async with self.redis.pipeline(transaction=self.transactional) as pipe:
+            for key, value in items.items():
+                pipe.setex(key, self._jittered_ttl(ttl, max_ttl), value)
+            await pipe.execute()
@@ -0,0 +1,155 @@
+import asyncio
+import atexit
+import threading
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class ClickAggregator:
+    """Write-behind buffer for click counts.
+
+    record() only bumps an in-memory counter; a background thread hands the
+    accumulated deltas to flush_fn every flush_interval seconds, so the
+    database sees one bulk increment per short ID per interval instead of one
+    write per click. Pending clicks are flushed on shutdown.
+
+    flush_fn returns the deltas it could not apply (or None if all were
+    applied), and only those are re-queued. It should raise only when none
+    of the deltas were written, since the whole batch is then re-queued.
+    After a failed flush the interval backs off up to max_backoff seconds.
+    The buffer holds at most max_keys short IDs. Once it is full, clicks for
+    new IDs are dropped and counted in `dropped`, so record() never blocks a
+    request on the database.
+    """
+
+    def __init__(self, flush_fn: Callable[[Dict[str, int]], Optional[Dict[str, int]]],
+                 flush_interval: float = 1.0, max_keys: int = 10000, max_backoff: float = 30.0):
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.max_backoff = max_backoff
+        self.dropped = 0
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="click-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, short_id: str, count: int = 1):
+        with self._lock:
+            if short_id not in self._counts:
+                if len(self._counts) >= self.max_keys:
+                    self.dropped += count
+                    return
+                if len(self._counts) + 1 == self.max_keys:
+                    # Just filled up: flush early on the background thread
+                    self._wake.set()
+            self._counts[short_id] += count
+
+    def _take(self) -> Dict[str, int]:
+        with self._lock:
+            deltas, self._counts = self._counts, defaultdict(int)
+        return dict(deltas)
+
+    def _requeue(self, failed: Dict[str, int]):
+        with self._lock:
+            for short_id, count in failed.items():
+                if short_id in self._counts or len(self._counts) < self.max_keys:
+                    self._counts[short_id] += count
+                else:
+                    self.dropped += count
+
+    def flush(self) -> bool:
+        """Hand the buffered deltas to flush_fn; returns False if any had to be re-queued."""
+        with self._flush_lock:
+            deltas = self._take()
+            if not deltas:
+                return True
+            try:
+                failed = self.flush_fn(deltas) or {}
+            except Exception as e:
+                print("Error flushing clicks:", e)
+                failed = deltas
+            self._requeue(failed)
+            return not failed
+
+    def _flush_loop(self):
+        delay = self.flush_interval
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stopped.is_set():
+                return
+            if self.flush():
+                delay = self.flush_interval
+            else:
+                delay = min(delay * 2, self.max_backoff)
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+
+class AsyncClickAggregator(ClickAggregator):
+    """ClickAggregator for async flush functions; flushes run as an event loop task.
+
+    Create it inside the running loop (e.g. in a startup hook) and await
+    close() on shutdown to flush what is left.
+    """
+
+    def __init__(self, flush_fn: Callable[[Dict[str, int]], Awaitable[Optional[Dict[str, int]]]],
+                 flush_interval: float = 1.0, max_keys: int = 10000, max_backoff: float = 30.0):
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.max_backoff = max_backoff
+        self.dropped = 0
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._stopped = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def flush(self) -> bool:
+        async with self._flush_lock:
+            deltas = self._take()
+            if not deltas:
+                return True
+            try:
+                failed = await self.flush_fn(deltas) or {}
+            except Exception as e:
+                print("Error flushing clicks:", e)
+                failed = deltas
+            self._requeue(failed)
+            return not failed
+
+    async def _flush_loop(self):
+        delay = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._stopped:
+                return
+            if await self.flush():
+                delay = self.flush_interval
+            else:
+                delay = min(delay * 2, self.max_backoff)
+
+    async def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wake.set()
+        await self._task
+        await self.flush()
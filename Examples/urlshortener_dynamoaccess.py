@@ -0,0 +1,144 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import boto3  # pip install boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
+
+
+def dynamodb_config(max_pool_connections: Optional[int] = None,
+                    retry_mode: Optional[str] = None,
+                    max_attempts: Optional[int] = None,
+                    connect_timeout: Optional[float] = None,
+                    read_timeout: Optional[float] = None) -> Config:
+    """botocore Config for DynamoDB; unset arguments fall back to DYNAMODB_* env vars."""
+    return Config(
+        # botocore's default of 10 connections is a bottleneck for threaded servers
+        max_pool_connections=max_pool_connections or int(os.getenv('DYNAMODB_MAX_POOL_CONNECTIONS', 50)),
+        retries={
+            'mode': retry_mode or os.getenv('DYNAMODB_RETRY_MODE', 'standard'),
+            'max_attempts': max_attempts or int(os.getenv('DYNAMODB_MAX_ATTEMPTS', 3))
+        },
+        connect_timeout=connect_timeout or float(os.getenv('DYNAMODB_CONNECT_TIMEOUT', 2)),
+        read_timeout=read_timeout or float(os.getenv('DYNAMODB_READ_TIMEOUT', 5)),
+        tcp_keepalive=True
+    )
+
+
+class DynamoDBAccess:
+    """Shared entry point for DynamoDB.
+
+    The low-level `client` is thread-safe and is shared by every thread, so
+    all of them draw from one tuned connection pool. boto3 resources are not
+    thread-safe, so `resource` and `table(name)` hand out one resource per
+    thread and cache its Table handles instead of rebuilding them per call.
+    """
+
+    _serializer = TypeSerializer()
+    _deserializer = TypeDeserializer()
+
+    def __init__(self, endpoint_url: Optional[str] = None, region_name: Optional[str] = None,
+                 config: Optional[Config] = None):
+        self.endpoint_url = endpoint_url
+        self.config = config or dynamodb_config()
+        self.session = boto3.session.Session(region_name=region_name)
+        self._lock = threading.Lock()  # Session.client/resource aren't thread-safe
+        self._local = threading.local()
+        self.client = self._create('client')
+
+    def _create(self, kind: str):
+        with self._lock:
+            factory = self.session.client if kind == 'client' else self.session.resource
+            return factory('dynamodb', endpoint_url=self.endpoint_url, config=self.config)
+
+    @property
+    def resource(self):
+        """This thread's DynamoDB service resource."""
+        resource = getattr(self._local, 'resource', None)
+        if resource is None:
+            resource = self._local.resource = self._create('resource')
+            self._local.tables = {}
+        return resource
+
+    def table(self, name: str):
+        """This thread's cached Table handle."""
+        resource = self.resource
+        tables = self._local.tables
+        if name not in tables:
+            tables[name] = resource.Table(name)
+        return tables[name]
+
+    # Low-level client path: plain dicts in and out, safe to call from any thread
+    def serialize(self, item: Dict) -> Dict:
+        return {key: self._serializer.serialize(value) for key, value in item.items()}
+
+    def deserialize(self, item: Dict) -> Dict:
+        return {key: self._deserializer.deserialize(value) for key, value in item.items()}
+
+    def get_item(self, table_name: str, key: Dict, **kwargs) -> Optional[Dict]:
+        response = self.client.get_item(TableName=table_name, Key=self.serialize(key), **kwargs)
+        return self.deserialize(response['Item']) if 'Item' in response else None
+
+    def put_item(self, table_name: str, item: Dict, **kwargs):
+        self.client.put_item(TableName=table_name, Item=self.serialize(item), **kwargs)
+
+
+# Benchmark against DynamoDB Local (docker-compose up -d dynamodb-local)
+BENCHMARK_TABLE = 'UrlShortenerBenchmark'
+
+def _ensure_benchmark_table(access: DynamoDBAccess, items: int):
+    if BENCHMARK_TABLE not in access.client.list_tables()['TableNames']:
+        access.client.create_table(
+            TableName=BENCHMARK_TABLE,
+            KeySchema=[{'AttributeName': 'shortUrlId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'shortUrlId', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        )
+        access.client.get_waiter('table_exists').wait(TableName=BENCHMARK_TABLE)
+    with access.table(BENCHMARK_TABLE).batch_writer() as batch:
+        for i in range(items):
+            batch.put_item(Item={'shortUrlId': f'bench{i}', 'longUrl': f'https://example.com/{i}'})
+
+def _run(name: str, get, requests: int, threads: int, items: int):
+    latencies = []
+
+    def worker(i):
+        start = time.perf_counter()
+        get(f'bench{i % items}')
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"{name:<10} {requests / elapsed:10.0f} req/s   "
+          f"p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms   "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms")
+
+def run_benchmark(endpoint_url: str, requests: int, threads: int, items: int):
+    access = DynamoDBAccess(endpoint_url=endpoint_url, region_name='us-east-1')
+    _ensure_benchmark_table(access, items)
+
+    # Baseline: one resource with default settings, a fresh Table handle per call
+    default_resource = boto3.resource('dynamodb', endpoint_url=endpoint_url, region_name='us-east-1')
+    _run('baseline', lambda short_id: default_resource.Table(BENCHMARK_TABLE).get_item(
+        Key={'shortUrlId': short_id}), requests, threads, items)
+    _run('resource', lambda short_id: access.table(BENCHMARK_TABLE).get_item(
+        Key={'shortUrlId': short_id}), requests, threads, items)
+    _run('client', lambda short_id: access.get_item(
+        BENCHMARK_TABLE, {'shortUrlId': short_id}), requests, threads, items)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark DynamoDB access paths against DynamoDB Local")
+    parser.add_argument('--endpoint', default='http://localhost:8000')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--items', type=int, default=1000)
+    args = parser.parse_args()
+    run_benchmark(args.endpoint, args.requests, args.threads, args.items)
@@ -1,29 +1,99 @@
-import boto3
 from datetime import datetime
 from typing import Dict, Optional, List
 from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 
-# DynamoDB Client
-dynamodb = boto3.resource('dynamodb', endpoint_url="http://localhost:8000", region_name='us-east-1')
+from urlshortener_idgen import is_valid_url, normalize_url, url_digest
+from urlshortener_dynamoaccess import DynamoDBAccess
+
+# DynamoDB Client: one tuned connection pool, Table handles cached per thread
+dynamo = DynamoDBAccess(endpoint_url="http://localhost:8000", region_name='us-east-1')
+TABLE_NAME = 'UrlShortener'
+
+DIGEST_INDEX = {
+    'IndexName': 'longUrlDigestIndex',
+    'KeySchema': [
+        {'AttributeName': 'longUrlDigest', 'KeyType': 'HASH'}
+    ],
+    'Projection': {
+        'ProjectionType': 'INCLUDE',
+        'NonKeyAttributes': ['longUrl']
+    },
+    'ProvisionedThroughput': {
+        'ReadCapacityUnits': 5,
+        'WriteCapacityUnits': 5
+    }
+}
+
+def create_digest_index_if_not_exists():
+    """Add longUrlDigestIndex to a table created before it existed."""
+    description = dynamo.client.describe_table(TableName=TABLE_NAME)['Table']
+    index_names = [index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])]
+    if DIGEST_INDEX['IndexName'] in index_names:
+        return
+    dynamo.client.update_table(
+        TableName=TABLE_NAME,
+        AttributeDefinitions=[
+            {'AttributeName': 'longUrlDigest', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexUpdates=[{'Create': DIGEST_INDEX}]
+    )
+    print("Creating longUrlDigestIndex...")
+
+def backfill_url_digests(only_missing: bool = True) -> int:
+    """Set longUrlDigest on items stored before the attribute existed.
+
+    With only_missing=False every digest is recomputed; run that once after
+    a change to normalize_url (e.g. IPv6 hosts now keep their brackets).
+    """
+    table = dynamo.table(TABLE_NAME)
+    updated = 0
+    kwargs = {'ProjectionExpression': 'shortUrlId, longUrl'}
+    if only_missing:
+        kwargs['FilterExpression'] = 'attribute_not_exists(longUrlDigest)'
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get('Items', []):
+            if not is_valid_url(item['longUrl']):
+                print("Skipping unparseable URL:", item['shortUrlId'])
+                continue
+            table.update_item(
+                Key={'shortUrlId': item['shortUrlId']},
+                UpdateExpression='SET longUrlDigest = :digest',
+                ExpressionAttributeValues={':digest': url_digest(item['longUrl'])}
+            )
+            updated += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return updated
 
 def create_url_table():
-    table_name = 'UrlShortener'
+    table_name = TABLE_NAME
 
     # Check if table already exists
-    existing_tables = dynamodb.meta.client.list_tables()["TableNames"]
+    existing_tables = dynamo.client.list_tables()["TableNames"]
     if table_name in existing_tables:
         print(f"Table {table_name} already exists.")
+        # Tables created before the digest index: add it and fill in the digests
+        create_digest_index_if_not_exists()
+        updated = backfill_url_digests()
+        if updated:
+            print(f"Backfilled longUrlDigest on {updated} items.")
         return
 
     # Define table schema
-    table = dynamodb.create_table(
+    table = dynamo.resource.create_table(
         TableName=table_name,
         KeySchema=[
             {'AttributeName': 'shortUrlId', 'KeyType': 'HASH'}  # Partition key
         ],
         AttributeDefinitions=[
-            {'AttributeName': 'shortUrlId', 'AttributeType': 'S'}
+            {'AttributeName': 'shortUrlId', 'AttributeType': 'S'},
+            {'AttributeName': 'longUrlDigest', 'AttributeType': 'S'}
         ],
+        # Digest instead of the URL itself: GSI key values are capped at 2 KB
+        GlobalSecondaryIndexes=[DIGEST_INDEX],
         ProvisionedThroughput={
             'ReadCapacityUnits': 5,
             'WriteCapacityUnits': 5
@@ -38,11 +108,12 @@ def create_url(short_url_id: str, long_url: str,
                title: Optional[str] = None, tags: Optional[List[str]] = None,
                expire_date: Optional[str] = None) -> Dict:
     """Create a new URL mapping"""
-    table = dynamodb.Table('UrlShortener')
+    table = dynamo.table(TABLE_NAME)
     
     item = {
         'shortUrlId': short_url_id,
         'longUrl': long_url,
+        'longUrlDigest': url_digest(long_url),
         'creationDate': datetime.now().isoformat(),
         'clicks': 0,
         'isActive': True,
@@ -59,23 +130,24 @@ def create_url(short_url_id: str, long_url: str,
 
 def get_short_url_id(long_url: str) -> Optional[str]:
     """Get short URL ID by long URL"""
-    table = dynamodb.Table('UrlShortener')
+    table = dynamo.table(TABLE_NAME)
     
     response = table.query(
-        IndexName='longUrlIndex',
-        KeyConditionExpression=Key('longUrl').eq(long_url)
+        IndexName='longUrlDigestIndex',
+        KeyConditionExpression=Key('longUrlDigest').eq(url_digest(long_url))
     )
     
-    items = response['Items']
-    if items:
-        return items[0]['shortUrlId']
-    else:
-        return None
+    # Confirm the match in case two URLs share a digest
+    normalized = normalize_url(long_url)
+    for item in response['Items']:
+        if normalize_url(item['longUrl']) == normalized:
+            return item['shortUrlId']
+    return None
 
 
 def get_url_by_id(short_url_id: str) -> Optional[Dict]:
     """Read a URL mapping by short URL ID"""
-    table = dynamodb.Table('UrlShortener')
+    table = dynamo.table(TABLE_NAME)
     
     response = table.get_item(
         Key={
@@ -92,9 +164,9 @@ def update_url(short_url_id: str,
                expire_date: Optional[str] = None,
                is_active: Optional[bool] = None) -> Dict:
     """Update a URL mapping"""
-    table = dynamodb.Table('UrlShortener')
+    table = dynamo.table(TABLE_NAME)
     
-    update_expr = ['SET']
+    update_expr = []
     expr_values = {}
     expr_names = {}
     
@@ -102,6 +174,9 @@ def update_url(short_url_id: str,
         update_expr.append('#lu = :lu')
         expr_values[':lu'] = long_url
         expr_names['#lu'] = 'longUrl'
+        update_expr.append('#lud = :lud')
+        expr_values[':lud'] = url_digest(long_url)
+        expr_names['#lud'] = 'longUrlDigest'
         
     if title is not None:
         update_expr.append('#md.#t = :t')
@@ -128,7 +203,7 @@ def update_url(short_url_id: str,
         Key={
             'shortUrlId': short_url_id
         },
-        UpdateExpression=' '.join(update_expr),
+        UpdateExpression='SET ' + ', '.join(update_expr),
         ExpressionAttributeValues=expr_values,
         ExpressionAttributeNames=expr_names,
         ReturnValues='ALL_NEW'
@@ -138,7 +213,7 @@ def update_url(short_url_id: str,
 
 def delete_url(short_url_id: str):
     """Delete a URL mapping"""
-    table = dynamodb.Table('UrlShortener')
+    table = dynamo.table(TABLE_NAME)
     
     table.delete_item(
         Key={
@@ -146,20 +221,58 @@ def delete_url(short_url_id: str):
         }
     )
 
-def increment_clicks(short_url_id: str):
+def increment_clicks(short_url_id: str, count: int = 1):
     """Increment the click count for a URL"""
-    table = dynamodb.Table('UrlShortener')
+    table = dynamo.table(TABLE_NAME)
     
+    # ADD works without an existing clicks attribute; the condition keeps a
+    # deleted URL from being recreated as a bare counter item
     table.update_item(
         Key={
             'shortUrlId': short_url_id
         },
-        UpdateExpression='SET clicks = clicks + :inc',
+        UpdateExpression='ADD clicks :inc',
+        ConditionExpression='attribute_exists(shortUrlId)',
         ExpressionAttributeValues={
-            ':inc': 1
+            ':inc': count
         }
     )
 
+# Errors that retrying the same update can't fix
+PERMANENT_CLICK_ERRORS = ('ConditionalCheckFailedException', 'ValidationException')
+
+def increment_clicks_bulk(deltas: Dict[str, int]) -> Dict[str, int]:
+    """Apply buffered click counts, one update per URL; returns the deltas that failed.
+
+    DynamoDB has no batch update, so this is the flush_fn to pair with
+    ClickAggregator: each URL is written once per flush however many clicks
+    it received. It runs on the aggregator's thread, so it uses the shared
+    low-level client. Clicks for deleted or invalid IDs are dropped; other
+    failures are returned so only they are retried.
+    """
+    failed = {}
+    items = list(deltas.items())
+    for i, (short_url_id, count) in enumerate(items):
+        try:
+            dynamo.client.update_item(
+                TableName=TABLE_NAME,
+                Key={'shortUrlId': {'S': short_url_id}},
+                UpdateExpression='ADD clicks :inc',
+                ConditionExpression='attribute_exists(shortUrlId)',
+                ExpressionAttributeValues={':inc': {'N': str(count)}}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] in PERMANENT_CLICK_ERRORS:
+                print("Dropping clicks for", short_url_id, ":", e)
+            else:
+                failed[short_url_id] = count
+        except Exception as e:
+            # Connection-level failure: keep this and every remaining delta
+            print("Error flushing clicks:", e)
+            failed.update(items[i:])
+            break
+    return failed
+
 # Example usage
 if __name__ == "__main__":
     # Create table if needed
@@ -0,0 +1,214 @@
+import hashlib
+import string
+import threading
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+# Same alphabet and length as generate_random_url in urlshortener_postgresql.py
+BASE62_ALPHABET = string.ascii_letters + string.digits
+SHORT_ID_LENGTH = 7
+KEY_SPACE = 62 ** SHORT_ID_LENGTH  # ~3.5 trillion IDs
+
+
+def base62_encode(value: int, length: int = SHORT_ID_LENGTH) -> str:
+    """Encode a non-negative integer as a fixed-length base62 string."""
+    chars = []
+    for _ in range(length):
+        value, rem = divmod(value, 62)
+        chars.append(BASE62_ALPHABET[rem])
+    if value:
+        raise ValueError("value does not fit in the short ID length")
+    return ''.join(reversed(chars))
+
+
+def base62_decode(short_id: str) -> int:
+    """Decode a base62 string back into its integer value."""
+    value = 0
+    for ch in short_id:
+        value = value * 62 + BASE62_ALPHABET.index(ch)
+    return value
+
+
+def normalize_url(long_url: str) -> str:
+    """Normalize a long URL so trivially different spellings hash the same.
+
+    Lowercases the scheme and host, drops default ports and the fragment,
+    and uses "/" for an empty path. The query string is kept as-is. Raises
+    ValueError for URLs that can't be parsed, such as a bad port or an
+    unclosed IPv6 bracket; check input with is_valid_url first.
+    """
+    parts = urlsplit(long_url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if ':' in netloc:
+        # Keep IPv6 literals bracketed so the port stays unambiguous
+        netloc = f"[{netloc}]"
+    if parts.username or parts.password:
+        userinfo = parts.username or ''
+        if parts.password:
+            userinfo += f":{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    default_port = {'http': 80, 'https': 443}.get(scheme)
+    if parts.port and parts.port != default_port:
+        netloc += f":{parts.port}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def is_valid_url(long_url) -> bool:
+    """True if long_url is a string normalize_url can handle."""
+    if not isinstance(long_url, str) or not long_url.strip():
+        return False
+    try:
+        normalize_url(long_url)
+    except ValueError:
+        return False
+    return True
+
+
+def url_digest(long_url: str) -> str:
+    """Fixed-size (64 hex chars) SHA-256 digest of the normalized long URL."""
+    return hashlib.sha256(normalize_url(long_url).encode('utf-8')).hexdigest()
+
+
+def content_hash_id(normalized_url: str, attempt: int = 0) -> str:
+    """Derive a short ID from a normalized URL; attempt selects the probe slot."""
+    digest = hashlib.sha256(f"{attempt}:{normalized_url}".encode('utf-8')).digest()
+    return base62_encode(int.from_bytes(digest, 'big') % KEY_SPACE)
+
+
+class FeistelPermutation:
+    """Keyed bijection over [0, KEY_SPACE).
+
+    A balanced Feistel network permutes 42-bit integers (2^42 is the smallest
+    even power of two above 62^7). Cycle-walking re-applies the network until
+    the result falls back inside the key space, which keeps it a bijection.
+    """
+
+    HALF_BITS = 21
+    HALF_MASK = (1 << HALF_BITS) - 1
+
+    def __init__(self, secret: bytes, rounds: int = 4):
+        self.secret = secret
+        self.rounds = rounds
+
+    def _round(self, half: int, i: int) -> int:
+        digest = hashlib.blake2b(half.to_bytes(3, 'big') + bytes([i]),
+                                 key=self.secret, digest_size=4).digest()
+        return int.from_bytes(digest, 'big') & self.HALF_MASK
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.HALF_BITS, value & self.HALF_MASK
+        for i in range(self.rounds):
+            left, right = right, left ^ self._round(right, i)
+        return (left << self.HALF_BITS) | right
+
+    def _decrypt(self, value: int) -> int:
+        left, right = value >> self.HALF_BITS, value & self.HALF_MASK
+        for i in reversed(range(self.rounds)):
+            left, right = right ^ self._round(left, i), left
+        return (left << self.HALF_BITS) | right
+
+    def permute(self, value: int) -> int:
+        value = self._encrypt(value)
+        while value >= KEY_SPACE:
+            value = self._encrypt(value)
+        return value
+
+    def invert(self, value: int) -> int:
+        value = self._decrypt(value)
+        while value >= KEY_SPACE:
+            value = self._decrypt(value)
+        return value
+
+
+class PostgreSQLRangeSource:
+    """Leases contiguous counter ranges from a PostgreSQL counter row.
+
+    Connections are borrowed from a PGConnectionPool for each lease.
+    """
+
+    def __init__(self, pg_pool, counter_name: str = 'short_id'):
+        self.pg_pool = pg_pool
+        self.counter_name = counter_name
+        self._table_ready = False
+
+    def lease(self, size: int) -> Tuple[int, int]:
+        """Reserve [start, end) in one statement; the first lease creates the row."""
+        with self.pg_pool.connection() as conn:
+            with conn.cursor() as cur:
+                if not self._table_ready:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS id_counters (
+                            name TEXT PRIMARY KEY,
+                            next_value BIGINT NOT NULL
+                        );
+                    """)
+                    self._table_ready = True
+                cur.execute("""
+                    INSERT INTO id_counters (name, next_value)
+                    VALUES (%s, %s)
+                    ON CONFLICT (name) DO UPDATE
+                    SET next_value = id_counters.next_value + EXCLUDED.next_value
+                    RETURNING next_value;
+                """, (self.counter_name, size))
+                end = cur.fetchone()[0]
+            conn.commit()
+        return end - size, end
+
+
+class RangeLeasedIdGenerator:
+    """Coordination-free short ID generator.
+
+    Counter values come from ranges leased once per range_size IDs, and each
+    value is mapped through a keyed Feistel permutation into a 7-character
+    base62 ID. IDs are unique and non-sequential with no per-request database
+    traffic. Don't share a collection with keys from the PostgreSQL key table,
+    since the two schemes can produce the same ID.
+    """
+
+    def __init__(self, source: PostgreSQLRangeSource, secret: str, range_size: int = 1000):
+        self.source = source
+        self.range_size = range_size
+        self.permutation = FeistelPermutation(secret.encode('utf-8'))
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def next_id(self) -> Optional[str]:
+        with self._lock:
+            if self._next >= self._end:
+                try:
+                    self._next, self._end = self.source.lease(self.range_size)
+                except Exception as e:
+                    print("Error leasing ID range:", e)
+                    return None
+                if self._end > KEY_SPACE:
+                    print("Error leasing ID range: key space exhausted")
+                    self._next = self._end = 0
+                    return None
+            value = self._next
+            self._next += 1
+        return base62_encode(self.permutation.permute(value))
+
+    def next_ids(self, count: int) -> List[str]:
+        """Hand out count IDs at once, leasing one larger range if needed.
+
+        Returns fewer than count IDs if a lease fails.
+        """
+        values = []
+        with self._lock:
+            while len(values) < count:
+                if self._next >= self._end:
+                    try:
+                        self._next, self._end = self.source.lease(max(self.range_size, count - len(values)))
+                    except Exception as e:
+                        print("Error leasing ID range:", e)
+                        break
+                    if self._end > KEY_SPACE:
+                        print("Error leasing ID range: key space exhausted")
+                        self._next = self._end = 0
+                        break
+                take = min(count - len(values), self._end - self._next)
+                values.extend(range(self._next, self._next + take))
+                self._next += take
+        return [base62_encode(self.permutation.permute(value)) for value in values]
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from collections import deque
+from typing import List, Optional
+
+from urlshortener_postgresql import claim_key_block
+
+
+class KeyPool:
+    """Thread-safe in-process pool of pre-claimed short URL keys.
+
+    Keys are leased from PostgreSQL in blocks with claim_key_block, using a
+    connection borrowed from a PGConnectionPool, so handing out a key needs
+    no database access. A background thread refills the pool
+    whenever it drops below the low-watermark.
+    """
+
+    def __init__(self, pg_pool, block_size: int = 1000,
+                 low_watermark: int = 200, refill_timeout: float = 5.0):
+        self.pg_pool = pg_pool
+        self.block_size = block_size
+        self.low_watermark = low_watermark
+        self.refill_timeout = refill_timeout
+
+        self._keys = deque()
+        self._lock = threading.Lock()
+        self._refill_needed = threading.Event()
+        self._refilled = threading.Condition(self._lock)
+        self._stopped = threading.Event()
+
+        self._refill_needed.set()
+        self._thread = threading.Thread(target=self._refill_loop, name="key-pool-refill", daemon=True)
+        self._thread.start()
+
+    def _claim_block(self) -> List[str]:
+        try:
+            with self.pg_pool.connection() as conn:
+                return claim_key_block(conn, self.block_size)
+        except Exception as e:
+            print("Error claiming key block:", e)
+            return []
+
+    def _refill_loop(self):
+        while not self._stopped.is_set():
+            self._refill_needed.wait()
+            if self._stopped.is_set():
+                break
+            keys = self._claim_block()
+            with self._lock:
+                self._keys.extend(keys)
+                if len(self._keys) >= self.low_watermark or not keys:
+                    self._refill_needed.clear()
+                self._refilled.notify_all()
+            if not keys:
+                # Key table exhausted or unreachable; back off before retrying
+                self._stopped.wait(1.0)
+
+    def get_key(self) -> Optional[str]:
+        """Hand out one unused key, waiting for a refill if the pool is empty."""
+        with self._lock:
+            if not self._keys:
+                self._refill_needed.set()
+                self._refilled.wait_for(lambda: self._keys or self._stopped.is_set(),
+                                        timeout=self.refill_timeout)
+            if not self._keys:
+                return None
+            key = self._keys.popleft()
+            if len(self._keys) < self.low_watermark:
+                self._refill_needed.set()
+            return key
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    def close(self):
+        """Stop the refill thread. Keys still in the pool stay marked as used."""
+        self._stopped.set()
+        self._refill_needed.set()
+        with self._lock:
+            self._refilled.notify_all()
+        self._thread.join(timeout=self.refill_timeout)
+
+
+class AsyncKeyPool:
+    """asyncio counterpart of KeyPool backed by an asyncpg connection pool.
+
+    Refills run as a task on the event loop instead of a thread; only one
+    refill is in flight at a time.
+    """
+
+    def __init__(self, pg_pool, block_size: int = 1000, low_watermark: int = 200):
+        self.pg_pool = pg_pool
+        self.block_size = block_size
+        self.low_watermark = low_watermark
+        self._keys = deque()
+        self._refill_lock = asyncio.Lock()
+        self._refill_task = None
+
+    async def _refill(self):
+        async with self._refill_lock:
+            if len(self._keys) >= self.low_watermark:
+                return
+            try:
+                rows = await self.pg_pool.fetch("""
+                    UPDATE urls
+                    SET used = TRUE
+                    WHERE id IN (
+                        SELECT id FROM urls
+                        WHERE used = FALSE
+                        ORDER BY id
+                        LIMIT $1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING short_url;
+                """, self.block_size)
+                self._keys.extend(row['short_url'].strip() for row in rows)
+            except Exception as e:
+                print("Error claiming key block:", e)
+
+    async def get_key(self) -> Optional[str]:
+        if not self._keys:
+            await self._refill()
+        elif len(self._keys) < self.low_watermark and (self._refill_task is None or self._refill_task.done()):
+            self._refill_task = asyncio.ensure_future(self._refill())
+        return self._keys.popleft() if self._keys else None
+
+    def size(self) -> int:
+        return len(self._keys)
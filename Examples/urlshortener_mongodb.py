@@ -1,6 +1,7 @@
-from pymongo import MongoClient
-from datetime import datetime
-from typing import Dict, List, Optional
+from pymongo import ASCENDING, DESCENDING, HASHED, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
 
 # MongoDB Connection
 def connect_to_mongodb():
@@ -8,6 +9,29 @@ def connect_to_mongodb():
     db = client["urlShortenerDB"]  # Database name
     return db
 
+# Fields a redirect needs; everything else stays on the server
+REDIRECT_PROJECTION = {"_id": 0, "longUrl": 1, "isActive": 1, "metadata.expireDate": 1}
+
+# Schema - Create the indexes the lookups below rely on (idempotent)
+def ensure_indexes(db) -> List[str]:
+    collection = db["urls"]
+    names = [
+        collection.create_index([("shortUrlId", ASCENDING)], unique=True, name="shortUrlId_unique"),
+        # Hashed keeps index entries small for long URLs; used for equality lookups only
+        collection.create_index([("longUrl", HASHED)], name="longUrl_hashed"),
+        collection.create_index([("userId", ASCENDING)], name="userId"),
+        collection.create_index([("metadata.expireDate", ASCENDING)], name="metadata_expireDate"),
+        # Cache warm-up: most-clicked first, with the recency filter checked on index keys
+        collection.create_index([("clicks", DESCENDING), ("lastClickDate", ASCENDING)],
+                                name="clicks_desc_lastClickDate"),
+        # Cheap "was anything clicked recently" check for the warm-up fallback
+        collection.create_index([("lastClickDate", DESCENDING)], name="lastClickDate", sparse=True),
+    ]
+    # Superseded by clicks_desc_lastClickDate; dropped once its replacement exists
+    if "clicks_desc" in collection.index_information():
+        collection.drop_index("clicks_desc")
+    return names
+
 # Create - Insert a new URL document
 def create_url(db, short_url_id: str, long_url: str, user_id: str,
                title: str = None, tags: List[str] = None, 
@@ -32,15 +56,70 @@ def create_url(db, short_url_id: str, long_url: str, user_id: str,
     return str(result.inserted_id)
 
 # Read - Get URL document by short ID
-def get_url_by_id(db, short_url_id: str) -> Optional[Dict]:
+def get_url_by_id(db, short_url_id: str, projection: Optional[Dict] = None) -> Optional[Dict]:
+    collection = db["urls"]
+    return collection.find_one({"shortUrlId": short_url_id}, projection)
+
+# Read - Get many URL documents by short ID, in input order
+def get_urls_by_ids(db, short_url_ids: List[str], projection: Optional[Dict] = None) -> List[Optional[Dict]]:
+    collection = db["urls"]
+    if projection is not None:
+        projection = {**projection, "shortUrlId": 1}
+    docs = {
+        doc["shortUrlId"]: doc
+        for doc in collection.find({"shortUrlId": {"$in": list(set(short_url_ids))}}, projection)
+    }
+    return [docs.get(short_url_id) for short_url_id in short_url_ids]
+
+# Read - Get short ID by long URL
+def get_short_url_id(db, long_url: str) -> Optional[str]:
     collection = db["urls"]
-    return collection.find_one({"shortUrlId": short_url_id})
+    result = collection.find_one({"longUrl": long_url}, {"_id": 0, "shortUrlId": 1})
+    return result["shortUrlId"] if result else None
+
+# Check - Whether a URL document can still be redirected to
+def is_url_active(document: Dict) -> bool:
+    if not document.get("isActive", True):
+        return False
+    expire_date = (document.get("metadata") or {}).get("expireDate")
+    return expire_date is None or expire_date > datetime.now()
+
+# Check - Seconds until a URL document expires (None if it never does)
+def seconds_until_expiry(document: Dict) -> Optional[float]:
+    expire_date = (document.get("metadata") or {}).get("expireDate")
+    if expire_date is None:
+        return None
+    return (expire_date - datetime.now()).total_seconds()
 
 # Read - Get all URLs for a user
 def get_urls_by_user(db, user_id: str) -> List[Dict]:
     collection = db["urls"]
     return list(collection.find({"userId": user_id}))
 
+# Read - Stream every short ID (used to rebuild the short ID filter)
+def iter_short_url_ids(db, batch_size: int = 10000) -> Iterator[str]:
+    collection = db["urls"]
+    for doc in collection.find({}, {"shortUrlId": 1, "_id": 0}).batch_size(batch_size):
+        yield doc["shortUrlId"]
+
+# Read - Stream the most-clicked URL documents, optionally only those clicked recently.
+# lastClickDate is only set by click flushes, so if nothing has one in the window
+# (e.g. a database from before it existed) this ranks by clicks alone.
+def iter_top_clicked(db, limit: int, projection: Optional[Dict] = None,
+                     clicked_within: Optional[timedelta] = None, batch_size: int = 1000,
+                     max_time: Optional[float] = None) -> Iterator[Dict]:
+    collection = db["urls"]
+    query = {"lastClickDate": {"$gte": datetime.now() - clicked_within}} if clicked_within else {}
+    if query and collection.find_one(query, {"_id": 1}) is None:
+        query = {}
+    if projection is not None:
+        projection = {**projection, "shortUrlId": 1}
+    cursor = collection.find(query, projection).sort("clicks", DESCENDING).limit(limit).batch_size(batch_size)
+    if max_time is not None:
+        # Server-side limit over every batch of the cursor; exceeding it raises ExecutionTimeout
+        cursor = cursor.max_time_ms(int(max_time * 1000))
+    yield from cursor
+
 # Update - Update URL document
 def update_url(db, short_url_id: str, updates: Dict) -> bool:
     collection = db["urls"]
@@ -59,6 +138,24 @@ def increment_clicks(db, short_url_id: str) -> bool:
     )
     return result.modified_count > 0
 
+# Update - Apply buffered click counts in one bulk write; returns the deltas that failed
+def increment_clicks_bulk(db, deltas: Dict[str, int]) -> Dict[str, int]:
+    if not deltas:
+        return {}
+    collection = db["urls"]
+    now = datetime.now()
+    items = list(deltas.items())
+    try:
+        collection.bulk_write(
+            [UpdateOne({"shortUrlId": short_url_id}, {"$inc": {"clicks": count}, "$set": {"lastClickDate": now}})
+             for short_url_id, count in items],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        # Unordered, so every update without a write error was applied
+        return {items[error["index"]][0]: items[error["index"]][1] for error in e.details.get("writeErrors", [])}
+    return {}
+
 # Delete - Delete URL document
 def delete_url(db, short_url_id: str) -> bool:
     collection = db["urls"]
@@ -69,6 +166,7 @@ def delete_url(db, short_url_id: str) -> bool:
 if __name__ == "__main__":
     # Connect to MongoDB and test CRUD operations
     db = connect_to_mongodb()
+    ensure_indexes(db)
     
     # Example usage
     url_id = create_url(
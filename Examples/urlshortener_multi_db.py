@@ -1,12 +1,22 @@
 from flask import Flask, request, jsonify
 import redis
 import os
+import json
+import time
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
-import psycopg2
-from pymongo import MongoClient
-import boto3
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple
+from psycopg2.extras import execute_values
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
+from urlshortener_pgpool import PGConnectionPool
+from urlshortener_dynamoaccess import DynamoDBAccess
+from urlshortener_cache import BackgroundRefresher, LocalCache, URLCache
+from urlshortener_bloom import ShortIdFilter
+from urlshortener_singleflight import SingleFlight
+from urlshortener_idgen import PostgreSQLRangeSource, RangeLeasedIdGenerator, content_hash_id, is_valid_url, normalize_url, url_digest
 # pip install flask redis psycopg2-binary pymongo boto3
 
 # export STORAGE_BACKEND=postgresql  # or mongodb or dynamodb
@@ -22,8 +32,31 @@ redis_client = redis.Redis(
     decode_responses=True
 )
 
+# In-process L1 cache in front of the Redis short ID lookups
+local_cache = LocalCache(
+    max_entries=int(os.getenv('L1_CACHE_MAX_ENTRIES', 10000)),
+    max_bytes=int(os.getenv('L1_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    ttl=float(os.getenv('L1_CACHE_TTL', 60))
+)
+# Cache key schema and TTL; reverse (long URL) keys use the same digest as the backends
+url_cache = URLCache(
+    redis_client,
+    long_prefix=os.getenv('CACHE_LONG_PREFIX', 'url:'),
+    short_prefix=os.getenv('CACHE_SHORT_PREFIX', 'id:'),
+    ttl=int(os.getenv('CACHE_TTL', 3600)),
+    local_cache=local_cache,
+    digest_long_keys=True,
+    # Spread expiries by +/- this fraction so a burst of writes doesn't expire at once
+    ttl_jitter=float(os.getenv('CACHE_TTL_JITTER', 0.1))
+)
+
 # Abstract Database Interface
+# Backends store a digest of the normalized long URL next to it and dedupe on
+# the digest, then confirm with a compare of the normalized URLs.
 class URLStorageBackend(ABC):
+    # True if store_many replaces an existing short_id instead of rejecting it
+    store_many_overwrites = False
+
     @abstractmethod
     def store_url(self, short_id: str, long_url: str) -> bool:
         pass
@@ -36,52 +69,184 @@ class URLStorageBackend(ABC):
     def url_exists(self, long_url: str) -> Optional[str]:
         pass
 
+    def url_exists_many(self, long_urls: List[str]) -> List[Optional[str]]:
+        """Batch url_exists; short IDs (or None) in input order."""
+        return [self.url_exists(long_url) for long_url in long_urls]
+
+    @abstractmethod
+    def store_many(self, mappings: List[Tuple[str, str]]) -> List[bool]:
+        """Store (short_id, long_url) pairs; one success flag per pair, in input order."""
+        pass
+
+    @abstractmethod
+    def get_many(self, short_ids: List[str]) -> List[Optional[str]]:
+        """Look up many short IDs; long URLs (or None) in input order."""
+        pass
+
+    @abstractmethod
+    def iter_short_ids(self) -> Iterator[str]:
+        """Stream every stored short ID, e.g. to rebuild the short ID filter."""
+        pass
+
 # PostgreSQL Implementation
+def create_pg_pool(min_size: int = None, max_size: int = None) -> PGConnectionPool:
+    return PGConnectionPool(
+        min_size=min_size if min_size is not None else int(os.getenv('PG_POOL_MIN', 1)),
+        max_size=max_size if max_size is not None else int(os.getenv('PG_POOL_MAX', 10)),
+        checkout_timeout=float(os.getenv('PG_POOL_TIMEOUT', 5)),
+        health_check_interval=float(os.getenv('PG_POOL_HEALTH_CHECK_INTERVAL', 30)),
+        dbname=os.getenv('PG_DATABASE', 'urlshortener'),
+        user=os.getenv('PG_USER', 'postgres'),
+        password=os.getenv('PG_PASSWORD', 'postgres'),
+        host=os.getenv('PG_HOST', 'localhost')
+    )
+
 class PostgreSQLBackend(URLStorageBackend):
     def __init__(self):
-        self.conn = psycopg2.connect(
-            dbname=os.getenv('PG_DATABASE', 'urlshortener'),
-            user=os.getenv('PG_USER', 'postgres'),
-            password=os.getenv('PG_PASSWORD', 'postgres'),
-            host=os.getenv('PG_HOST', 'localhost')
-        )
+        # Each call borrows its own pooled connection, so request threads don't share a socket
+        self.pool = create_pg_pool()
         self._create_table()
     
     def _create_table(self):
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS url_mappings (
-                    short_id VARCHAR(50) PRIMARY KEY,
-                    long_url TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-        self.conn.commit()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS url_mappings (
+                        short_id VARCHAR(50) PRIMARY KEY,
+                        long_url TEXT NOT NULL,
+                        long_url_digest CHAR(64),
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                # Tables created before the digest column; backfill_url_digests() runs at startup
+                cur.execute("ALTER TABLE url_mappings ADD COLUMN IF NOT EXISTS long_url_digest CHAR(64)")
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS url_mappings_digest_idx
+                    ON url_mappings (long_url_digest)
+                """)
+            conn.commit()
+
+    def backfill_url_digests(self, batch_size: int = 1000, only_missing: bool = True) -> int:
+        """Compute long_url_digest for rows stored before the column existed.
+
+        Rows whose URL can't be parsed are skipped. With only_missing=False
+        every digest is recomputed; run that once after a change to
+        normalize_url, e.g. the switch to keeping IPv6 brackets, which changed
+        the digest of every IPv6-literal URL.
+        """
+        updated = 0
+        last_short_id = ''
+        missing = " AND long_url_digest IS NULL" if only_missing else ""
+        while True:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    # Keyset pagination, so skipped rows aren't selected again
+                    cur.execute(
+                        "SELECT short_id, long_url FROM url_mappings WHERE short_id > %s" + missing +
+                        " ORDER BY short_id LIMIT %s",
+                        (last_short_id, batch_size)
+                    )
+                    rows = cur.fetchall()
+                    if not rows:
+                        break
+                    last_short_id = rows[-1][0]
+                    digests = [(short_id, url_digest(long_url)) for short_id, long_url in rows
+                               if is_valid_url(long_url)]
+                    if digests:
+                        execute_values(cur, """
+                            UPDATE url_mappings AS m SET long_url_digest = v.digest
+                            FROM (VALUES %s) AS v (short_id, digest)
+                            WHERE m.short_id = v.short_id
+                        """, digests)
+                conn.commit()
+            updated += len(digests)
+        return updated
 
     def store_url(self, short_id: str, long_url: str) -> bool:
         try:
-            with self.conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO url_mappings (short_id, long_url) VALUES (%s, %s)",
-                    (short_id, long_url)
-                )
-            self.conn.commit()
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "INSERT INTO url_mappings (short_id, long_url, long_url_digest) VALUES (%s, %s, %s)",
+                        (short_id, long_url, url_digest(long_url))
+                    )
+                conn.commit()
             return True
         except Exception:
-            self.conn.rollback()
+            # The pool rolls back the failed transaction when the connection is returned
             return False
 
     def get_url(self, short_id: str) -> Optional[str]:
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT long_url FROM url_mappings WHERE short_id = %s", (short_id,))
-            result = cur.fetchone()
-            return result[0] if result else None
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT long_url FROM url_mappings WHERE short_id = %s", (short_id,))
+                result = cur.fetchone()
+                return result[0] if result else None
 
     def url_exists(self, long_url: str) -> Optional[str]:
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT short_id FROM url_mappings WHERE long_url = %s", (long_url,))
-            result = cur.fetchone()
-            return result[0] if result else None
+        normalized = normalize_url(long_url)
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT short_id, long_url FROM url_mappings WHERE long_url_digest = %s",
+                    (url_digest(long_url),)
+                )
+                for short_id, stored_url in cur.fetchall():
+                    if normalize_url(stored_url) == normalized:
+                        return short_id
+                return None
+
+    def url_exists_many(self, long_urls: List[str]) -> List[Optional[str]]:
+        if not long_urls:
+            return []
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT short_id, long_url FROM url_mappings WHERE long_url_digest = ANY(%s)",
+                    (list({url_digest(long_url) for long_url in long_urls}),)
+                )
+                found = {normalize_url(stored_url): short_id for short_id, stored_url in cur.fetchall()}
+        return [found.get(normalize_url(long_url)) for long_url in long_urls]
+
+    def store_many(self, mappings: List[Tuple[str, str]]) -> List[bool]:
+        if not mappings:
+            return []
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    # One multi-row INSERT; existing short IDs are skipped, not fatal
+                    inserted = execute_values(cur, """
+                        INSERT INTO url_mappings (short_id, long_url, long_url_digest) VALUES %s
+                        ON CONFLICT (short_id) DO NOTHING
+                        RETURNING short_id
+                    """, [(short_id, long_url, url_digest(long_url)) for short_id, long_url in mappings],
+                        page_size=1000, fetch=True)
+                conn.commit()
+        except Exception:
+            return [False] * len(mappings)
+        stored = {row[0] for row in inserted}
+        return [short_id in stored for short_id, _ in mappings]
+
+    def get_many(self, short_ids: List[str]) -> List[Optional[str]]:
+        if not short_ids:
+            return []
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT short_id, long_url FROM url_mappings WHERE short_id = ANY(%s)",
+                    (list(short_ids),)
+                )
+                found = dict(cur.fetchall())
+        return [found.get(short_id) for short_id in short_ids]
+
+    def iter_short_ids(self) -> Iterator[str]:
+        # The server-side cursor keeps its transaction open, so the connection is held while streaming
+        with self.pool.connection() as conn:
+            with conn.cursor(name='iter_short_ids') as cur:
+                cur.itersize = 10000
+                cur.execute("SELECT short_id FROM url_mappings")
+                for (short_id,) in cur:
+                    yield short_id
 
 # MongoDB Implementation
 class MongoDBBackend(URLStorageBackend):
@@ -89,12 +254,42 @@ class MongoDBBackend(URLStorageBackend):
         self.client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
         self.db = self.client.urlshortener
         self.collection = self.db.url_mappings
+        # Makes a duplicate short_id fail store_url instead of adding a second document
+        self.collection.create_index('short_id', unique=True)
+        self.collection.create_index('long_url_digest')
+
+    def backfill_url_digests(self, batch_size: int = 1000, only_missing: bool = True) -> int:
+        """Compute long_url_digest for documents stored before the field existed.
+
+        Documents whose URL can't be parsed are skipped. With only_missing=False
+        every digest is recomputed; run that once after a change to
+        normalize_url, e.g. the switch to keeping IPv6 brackets, which changed
+        the digest of every IPv6-literal URL.
+        """
+        updated = 0
+        query = {'long_url_digest': {'$exists': False}} if only_missing else {}
+        last_id = None
+        while True:
+            page = dict(query, _id={'$gt': last_id}) if last_id is not None else query
+            docs = list(self.collection.find(page, {'long_url': 1}).sort('_id', 1).limit(batch_size))
+            if not docs:
+                break
+            last_id = docs[-1]['_id']
+            updates = [
+                UpdateOne({'_id': doc['_id']}, {'$set': {'long_url_digest': url_digest(doc['long_url'])}})
+                for doc in docs if is_valid_url(doc['long_url'])
+            ]
+            if updates:
+                self.collection.bulk_write(updates, ordered=False)
+            updated += len(updates)
+        return updated
 
     def store_url(self, short_id: str, long_url: str) -> bool:
         try:
             self.collection.insert_one({
                 'short_id': short_id,
-                'long_url': long_url
+                'long_url': long_url,
+                'long_url_digest': url_digest(long_url)
             })
             return True
         except Exception:
@@ -105,16 +300,90 @@ class MongoDBBackend(URLStorageBackend):
         return result['long_url'] if result else None
 
     def url_exists(self, long_url: str) -> Optional[str]:
-        result = self.collection.find_one({'long_url': long_url})
-        return result['short_id'] if result else None
+        normalized = normalize_url(long_url)
+        candidates = self.collection.find(
+            {'long_url_digest': url_digest(long_url)}, {'short_id': 1, 'long_url': 1, '_id': 0}
+        )
+        for doc in candidates:
+            if normalize_url(doc['long_url']) == normalized:
+                return doc['short_id']
+        return None
+
+    def url_exists_many(self, long_urls: List[str]) -> List[Optional[str]]:
+        if not long_urls:
+            return []
+        candidates = self.collection.find(
+            {'long_url_digest': {'$in': list({url_digest(long_url) for long_url in long_urls})}},
+            {'short_id': 1, 'long_url': 1, '_id': 0}
+        )
+        found = {normalize_url(doc['long_url']): doc['short_id'] for doc in candidates}
+        return [found.get(normalize_url(long_url)) for long_url in long_urls]
+
+    def store_many(self, mappings: List[Tuple[str, str]]) -> List[bool]:
+        if not mappings:
+            return []
+        results = [True] * len(mappings)
+        try:
+            # Unordered, so one duplicate doesn't stop the rest of the batch
+            self.collection.insert_many([
+                {'short_id': short_id, 'long_url': long_url, 'long_url_digest': url_digest(long_url)}
+                for short_id, long_url in mappings
+            ], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                results[error['index']] = False
+        except Exception:
+            return [False] * len(mappings)
+        return results
+
+    def get_many(self, short_ids: List[str]) -> List[Optional[str]]:
+        if not short_ids:
+            return []
+        found = {
+            doc['short_id']: doc['long_url']
+            for doc in self.collection.find(
+                {'short_id': {'$in': list(set(short_ids))}}, {'short_id': 1, 'long_url': 1, '_id': 0}
+            )
+        }
+        return [found.get(short_id) for short_id in short_ids]
+
+    def iter_short_ids(self) -> Iterator[str]:
+        for doc in self.collection.find({}, {'short_id': 1, '_id': 0}).batch_size(10000):
+            yield doc['short_id']
 
 # DynamoDB Implementation
 class DynamoDBBackend(URLStorageBackend):
     def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb')
-        self.table = self.dynamodb.Table('url_mappings')
+        self.dynamo = DynamoDBAccess(
+            endpoint_url=os.getenv('DYNAMODB_ENDPOINT'),
+            region_name=os.getenv('AWS_REGION')
+        )
         self._create_table_if_not_exists()
 
+    # boto3 resources aren't thread-safe; each request thread gets its own cached handles
+    @property
+    def dynamodb(self):
+        return self.dynamo.resource
+
+    @property
+    def table(self):
+        return self.dynamo.table('url_mappings')
+
+    DIGEST_INDEX = {
+        'IndexName': 'long_url_digest_index',
+        'KeySchema': [
+            {'AttributeName': 'long_url_digest', 'KeyType': 'HASH'}
+        ],
+        'Projection': {
+            'ProjectionType': 'INCLUDE',
+            'NonKeyAttributes': ['long_url']
+        },
+        'ProvisionedThroughput': {
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5
+        }
+    }
+
     def _create_table_if_not_exists(self):
         try:
             self.dynamodb.create_table(
@@ -123,8 +392,10 @@ class DynamoDBBackend(URLStorageBackend):
                     {'AttributeName': 'short_id', 'KeyType': 'HASH'}
                 ],
                 AttributeDefinitions=[
-                    {'AttributeName': 'short_id', 'AttributeType': 'S'}
+                    {'AttributeName': 'short_id', 'AttributeType': 'S'},
+                    {'AttributeName': 'long_url_digest', 'AttributeType': 'S'}
                 ],
+                GlobalSecondaryIndexes=[self.DIGEST_INDEX],
                 ProvisionedThroughput={
                     'ReadCapacityUnits': 5,
                     'WriteCapacityUnits': 5
@@ -133,14 +404,59 @@ class DynamoDBBackend(URLStorageBackend):
         except ClientError as e:
             if e.response['Error']['Code'] != 'ResourceInUseException':
                 raise
+            self._create_digest_index_if_not_exists()
+
+    def _create_digest_index_if_not_exists(self):
+        """Add the digest GSI to a table created before it existed."""
+        description = self.dynamo.client.describe_table(TableName='url_mappings')['Table']
+        index_names = [index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])]
+        if self.DIGEST_INDEX['IndexName'] in index_names:
+            return
+        self.dynamo.client.update_table(
+            TableName='url_mappings',
+            AttributeDefinitions=[
+                {'AttributeName': 'long_url_digest', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexUpdates=[{'Create': self.DIGEST_INDEX}]
+        )
+
+    def backfill_url_digests(self, only_missing: bool = True) -> int:
+        """Compute long_url_digest for items stored before the attribute existed.
+
+        Items whose URL can't be parsed are skipped. With only_missing=False
+        every digest is recomputed; run that once after a change to
+        normalize_url, e.g. the switch to keeping IPv6 brackets, which changed
+        the digest of every IPv6-literal URL.
+        """
+        updated = 0
+        kwargs = {'ProjectionExpression': 'short_id, long_url'}
+        if only_missing:
+            kwargs['FilterExpression'] = 'attribute_not_exists(long_url_digest)'
+        while True:
+            response = self.table.scan(**kwargs)
+            for item in response.get('Items', []):
+                if not is_valid_url(item['long_url']):
+                    continue
+                self.table.update_item(
+                    Key={'short_id': item['short_id']},
+                    UpdateExpression='SET long_url_digest = :digest',
+                    ExpressionAttributeValues={':digest': url_digest(item['long_url'])}
+                )
+                updated += 1
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return updated
 
     def store_url(self, short_id: str, long_url: str) -> bool:
         try:
             self.table.put_item(
                 Item={
                     'short_id': short_id,
-                    'long_url': long_url
-                }
+                    'long_url': long_url,
+                    'long_url_digest': url_digest(long_url)
+                },
+                ConditionExpression='attribute_not_exists(short_id)'
             )
             return True
         except Exception:
@@ -155,15 +471,235 @@ class DynamoDBBackend(URLStorageBackend):
 
     def url_exists(self, long_url: str) -> Optional[str]:
         try:
-            response = self.table.scan(
-                FilterExpression='long_url = :url',
-                ExpressionAttributeValues={':url': long_url}
+            normalized = normalize_url(long_url)
+            response = self.table.query(
+                IndexName='long_url_digest_index',
+                KeyConditionExpression=Key('long_url_digest').eq(url_digest(long_url))
             )
-            items = response.get('Items', [])
-            return items[0]['short_id'] if items else None
+            for item in response.get('Items', []):
+                if normalize_url(item['long_url']) == normalized:
+                    return item['short_id']
+            return None
         except Exception:
             return None
 
+    store_many_overwrites = True
+
+    BATCH_WRITE_SIZE = 25  # DynamoDB limits
+    BATCH_GET_SIZE = 100
+    BATCH_MAX_ATTEMPTS = 5
+
+    def store_many(self, mappings: List[Tuple[str, str]]) -> List[bool]:
+        """Store with batch_write_item, retrying unprocessed items with backoff.
+
+        BatchWriteItem can't be conditional, so unlike store_url an existing
+        short_id is overwritten; use it with freshly generated IDs only.
+        """
+        pending = {}
+        for short_id, long_url in mappings:
+            pending[short_id] = {'PutRequest': {'Item': {
+                'short_id': short_id,
+                'long_url': long_url,
+                'long_url_digest': url_digest(long_url)
+            }}}
+        requests = list(pending.values())
+        failed = set()
+        for start in range(0, len(requests), self.BATCH_WRITE_SIZE):
+            batch = {'url_mappings': requests[start:start + self.BATCH_WRITE_SIZE]}
+            for attempt in range(self.BATCH_MAX_ATTEMPTS):
+                try:
+                    response = self.dynamodb.batch_write_item(RequestItems=batch)
+                except ClientError:
+                    break
+                batch = response.get('UnprocessedItems') or {}
+                if not batch:
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+            for request_item in batch.get('url_mappings', []):
+                failed.add(request_item['PutRequest']['Item']['short_id'])
+        return [short_id not in failed for short_id, _ in mappings]
+
+    def get_many(self, short_ids: List[str]) -> List[Optional[str]]:
+        """Look up with batch_get_item, retrying unprocessed keys with backoff."""
+        found = {}
+        unique_ids = list(dict.fromkeys(short_ids))  # BatchGetItem rejects duplicate keys
+        for start in range(0, len(unique_ids), self.BATCH_GET_SIZE):
+            batch = {'url_mappings': {
+                'Keys': [{'short_id': short_id} for short_id in unique_ids[start:start + self.BATCH_GET_SIZE]],
+                'ProjectionExpression': 'short_id, long_url'
+            }}
+            for attempt in range(self.BATCH_MAX_ATTEMPTS):
+                try:
+                    response = self.dynamodb.batch_get_item(RequestItems=batch)
+                except ClientError:
+                    break
+                for item in response['Responses'].get('url_mappings', []):
+                    found[item['short_id']] = item['long_url']
+                batch = response.get('UnprocessedKeys') or {}
+                if not batch:
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+        return [found.get(short_id) for short_id in short_ids]
+
+    def iter_short_ids(self) -> Iterator[str]:
+        kwargs = {'ProjectionExpression': 'short_id'}
+        while True:
+            response = self.table.scan(**kwargs)
+            for item in response.get('Items', []):
+                yield item['short_id']
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+# Caching decorator
+class CachedStorageBackend(URLStorageBackend):
+    """Puts a URLCache in front of any URLStorageBackend.
+
+    The URLCache fixes the key schema and TTL. Under every policy a read miss
+    loads from the backend and fills the cache, and concurrent misses for the
+    same key share one backend load. The policy decides what writes do:
+      cache-aside   - writes go to the backend only
+      read-through  - same as cache-aside (kept as a CACHE_POLICY value)
+      write-through - successful writes are cached at once
+    With a ShortIdFilter, short ID misses it rules out skip the backend, and
+    backend misses are recorded in it. Cache hits and misses are counted per
+    lookup direction; see stats().
+    """
+
+    POLICIES = ('cache-aside', 'read-through', 'write-through')
+
+    def __init__(self, backend: URLStorageBackend, cache: URLCache, policy: str = 'cache-aside',
+                 short_id_filter: Optional[ShortIdFilter] = None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self.backend = backend
+        self.cache = cache
+        self.policy = policy
+        self.short_id_filter = short_id_filter
+        self._loads = SingleFlight()
+        self._lock = threading.Lock()
+        self.hits = {'short_id': 0, 'long_url': 0}
+        self.misses = {'short_id': 0, 'long_url': 0}
+        self.filtered = 0
+
+    def __getattr__(self, name):
+        # Backend-specific extras such as backfill_url_digests
+        if name == 'backend':
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    @property
+    def store_many_overwrites(self) -> bool:
+        return self.backend.store_many_overwrites
+
+    def _count(self, kind: str, hits: int, misses: int):
+        with self._lock:
+            self.hits[kind] += hits
+            self.misses[kind] += misses
+
+    def _ruled_out(self, short_id: str) -> bool:
+        if self.short_id_filter is None or self.short_id_filter.might_exist(short_id):
+            return False
+        with self._lock:
+            self.filtered += 1
+        return True
+
+    def _stored(self, mappings: List[Tuple[str, str]]):
+        if self.short_id_filter is not None:
+            for short_id, _ in mappings:
+                self.short_id_filter.add(short_id)
+        if self.policy == 'write-through':
+            self.cache.set_mappings(mappings)
+
+    def cache_mappings(self, mappings: Iterable[Tuple[str, str]]):
+        """Cache mappings read or written directly through self.backend."""
+        self.cache.set_mappings(mappings)
+
+    def store_url(self, short_id: str, long_url: str) -> bool:
+        if not self.backend.store_url(short_id, long_url):
+            return False
+        self._stored([(short_id, long_url)])
+        return True
+
+    def store_many(self, mappings: List[Tuple[str, str]]) -> List[bool]:
+        stored = self.backend.store_many(mappings)
+        self._stored([mapping for mapping, ok in zip(mappings, stored) if ok])
+        return stored
+
+    def refresh(self, short_id: str) -> Optional[str]:
+        """Reload short_id from the backend into the cache."""
+        long_url = self.backend.get_url(short_id)
+        if long_url:
+            self.cache.set_mapping(short_id, long_url)
+        elif self.short_id_filter is not None:
+            self.short_id_filter.record_miss(short_id)
+        return long_url
+
+    def get_url(self, short_id: str) -> Optional[str]:
+        long_url = self.cache.get_long_url(short_id)
+        self._count('short_id', bool(long_url), not long_url)
+        if long_url:
+            return long_url
+        if self._ruled_out(short_id):
+            return None
+        return self._loads.do(f"id:{short_id}", lambda: self.refresh(short_id))
+
+    def get_many(self, short_ids: List[str]) -> List[Optional[str]]:
+        unique_ids = list(dict.fromkeys(short_ids))
+        found = dict(zip(unique_ids, self.cache.get_long_urls(unique_ids)))
+        misses = [short_id for short_id, long_url in found.items() if not long_url]
+        self._count('short_id', len(unique_ids) - len(misses), len(misses))
+        misses = [short_id for short_id in misses if not self._ruled_out(short_id)]
+        backfill = []
+        if misses:
+            for short_id, long_url in zip(misses, self.backend.get_many(misses)):
+                if long_url:
+                    found[short_id] = long_url
+                    backfill.append((short_id, long_url))
+                elif self.short_id_filter is not None:
+                    self.short_id_filter.record_miss(short_id)
+        self.cache.set_mappings(backfill)
+        return [found.get(short_id) or None for short_id in short_ids]
+
+    def _load_short_id(self, long_url: str) -> Optional[str]:
+        short_id = self.backend.url_exists(long_url)
+        if short_id:
+            self.cache.set_mapping(short_id, long_url)
+        return short_id
+
+    def url_exists(self, long_url: str) -> Optional[str]:
+        short_id = self.cache.get_short_id(long_url)
+        self._count('long_url', bool(short_id), not short_id)
+        if short_id:
+            return short_id
+        return self._loads.do(f"url:{url_digest(long_url)}", lambda: self._load_short_id(long_url))
+
+    def url_exists_many(self, long_urls: List[str]) -> List[Optional[str]]:
+        results = self.cache.get_short_ids(long_urls)
+        missing = [i for i, short_id in enumerate(results) if not short_id]
+        self._count('long_url', len(long_urls) - len(missing), len(missing))
+        if missing:
+            backfill = []
+            for i, short_id in zip(missing, self.backend.url_exists_many([long_urls[i] for i in missing])):
+                results[i] = short_id
+                if short_id:
+                    backfill.append((short_id, long_urls[i]))
+            self.cache.set_mappings(backfill)
+        return [short_id or None for short_id in results]
+
+    def iter_short_ids(self) -> Iterator[str]:
+        return self.backend.iter_short_ids()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {'policy': self.policy, 'filtered': self.filtered}
+            for kind in ('short_id', 'long_url'):
+                lookups = self.hits[kind] + self.misses[kind]
+                stats[f'{kind}_hits'] = self.hits[kind]
+                stats[f'{kind}_misses'] = self.misses[kind]
+                stats[f'{kind}_hit_ratio'] = self.hits[kind] / lookups if lookups else 0.0
+            return stats
+
 # Database factory
 def get_storage_backend() -> URLStorageBackend:
     backend_type = os.getenv('STORAGE_BACKEND', 'postgresql')
@@ -174,16 +710,134 @@ def get_storage_backend() -> URLStorageBackend:
     }
     return backends[backend_type]()
 
-# Initialize storage backend
-storage = get_storage_backend()
+# Filter of issued short IDs so unknown IDs get a 404 without a database query.
+# SHORT_ID_FILTER_BACKEND=redis (default) keeps it as one Redis bitmap shared by
+# every worker (~12 MB per 10M capacity), along with the negative cache. local
+# keeps both per process (~12 MB per 10M, twice that while rebuilding) and only
+# sees this process's new IDs, so use it with a single worker only. The filter
+# is rebuilt from the database every SHORT_ID_FILTER_REBUILD_INTERVAL seconds.
+short_id_filter = ShortIdFilter(
+    capacity=int(os.getenv('SHORT_ID_FILTER_CAPACITY', 10_000_000)),
+    error_rate=float(os.getenv('SHORT_ID_FILTER_ERROR_RATE', 0.01)),
+    negative_ttl=float(os.getenv('NEGATIVE_CACHE_TTL', 30)),
+    redis_client=redis_client if os.getenv('SHORT_ID_FILTER_BACKEND', 'redis') == 'redis' else None
+)
+
+# Initialize storage backend; CACHE_POLICY=cache-aside, read-through or write-through
+storage = CachedStorageBackend(
+    get_storage_backend(),
+    url_cache,
+    policy=os.getenv('CACHE_POLICY', 'write-through'),
+    short_id_filter=short_id_filter
+)
+short_id_filter.rebuild_in_background(storage.iter_short_ids,
+                                      interval=float(os.getenv('SHORT_ID_FILTER_REBUILD_INTERVAL', 3600)))
+
+def backfill_url_digests():
+    """Give rows stored before digests existed one, so url_exists can find them."""
+    try:
+        updated = storage.backfill_url_digests()
+        if updated:
+            print(f"Backfilled long URL digests on {updated} rows")
+    except Exception as e:
+        print("Error backfilling long URL digests:", e)
+
+# Until this finishes, pre-digest rows can't be found by long URL (a repeat
+# shorten creates a second ID); it is a no-op once every row has a digest
+threading.Thread(target=backfill_url_digests, name="url-digest-backfill", daemon=True).start()
+
+# Hot keys are reloaded in the background shortly before they expire (0 disables)
+CACHE_EARLY_REFRESH_BETA = float(os.getenv('CACHE_EARLY_REFRESH_BETA', 1.0))
+if CACHE_EARLY_REFRESH_BETA > 0:
+    url_cache.refresher = BackgroundRefresher(storage.refresh, beta=CACHE_EARLY_REFRESH_BETA)
+
+# Short ID generator: counter ranges are leased from PostgreSQL once per range
+# (a small lazily filled pool; leases are rare)
+id_generator = RangeLeasedIdGenerator(
+    PostgreSQLRangeSource(create_pg_pool(min_size=0, max_size=2)),
+    secret=os.getenv('SHORT_ID_SECRET', 'change-me'),
+    range_size=int(os.getenv('ID_RANGE_SIZE', 1000))
+)
+
+def generate_short_id() -> Optional[str]:
+    return id_generator.next_id()
+
+# Content-hash short IDs
+class ContentHashStrategy:
+    """Derives the short ID from a hash of the normalized long URL.
+
+    Collisions are resolved by deterministic probing (attempt 0, 1, ...), so a
+    repeat create resolves with a primary-key get_url instead of a reverse
+    lookup. Works with any URLStorageBackend whose store_url rejects an
+    existing short_id.
+    """
+
+    def __init__(self, max_probes: int = 8):
+        self.max_probes = max_probes
+
+    @staticmethod
+    def same_url(existing: str, normalized: str) -> bool:
+        """Whether a stored long URL normalizes to `normalized`; unparseable ones never match."""
+        return is_valid_url(existing) and normalize_url(existing) == normalized
+
+    def resolve(self, backend: URLStorageBackend, long_url: str) -> Tuple[Optional[str], bool]:
+        """Return (short_id, created) for long_url.
+
+        (None, False) if every probe slot holds a different URL, or if a
+        store fails for any reason other than the slot being taken.
+        """
+        normalized = normalize_url(long_url)
+        for attempt in range(self.max_probes):
+            short_id = content_hash_id(normalized, attempt)
+            existing = backend.get_url(short_id)
+            if existing is None:
+                if backend.store_url(short_id, long_url):
+                    return short_id, True
+                # Lost a race for this slot; see who took it
+                existing = backend.get_url(short_id)
+                if existing is None:
+                    # Nobody did, so the write itself failed; probing on would
+                    # store the URL under a different ID than later creates find
+                    return None, False
+            if self.same_url(existing, normalized):
+                return short_id, False
+        return None, False
+
+# SHORT_ID_MODE=counter (default) or content_hash
+SHORT_ID_MODE = os.getenv('SHORT_ID_MODE', 'counter')
+content_hash_strategy = ContentHashStrategy(int(os.getenv('CONTENT_HASH_MAX_PROBES', 8)))
+
+# Rate limiting configuration
+from urlshortener_ratelimit import RouteRateLimiter, route_limits_from_env
 
-# ... (keep the rate limiting code from the original file) ...
+# Rate limit settings
+RATE_LIMIT = 10  # requests
+TIME_WINDOW = 60  # seconds
+
+# Sliding-window counters with fixed-size state per IP; idle IPs are evicted LRU.
+# Per-route limits are keyed by Flask endpoint name; without CREATE_RATE_LIMIT or
+# REDIRECT_RATE_LIMIT every route shares the default RATE_LIMIT budget.
+# RATE_LIMIT_BACKEND=redis shares the counters across workers through Redis.
+rate_limiter = RouteRateLimiter(
+    RATE_LIMIT,
+    TIME_WINDOW,
+    route_limits=route_limits_from_env({
+        "create_short_url": 'CREATE_RATE_LIMIT',
+        "redirect_to_long_url": 'REDIRECT_RATE_LIMIT'
+    }, TIME_WINDOW),
+    max_clients=int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 100000)),
+    redis_client=redis_client if os.getenv('RATE_LIMIT_BACKEND', 'memory') == 'redis' else None
+)
+
+def is_rate_limited(ip_address, route=None):
+    """Check if an IP address has exceeded the rate limit."""
+    return rate_limiter.is_rate_limited(ip_address, route)
 
 @app.route("/urls", methods=["POST"])
 def create_short_url():
-    # Rate limiting check (keep existing code)
+    # Rate limiting check
     client_ip = request.remote_addr
-    if is_rate_limited(client_ip):
+    if is_rate_limited(client_ip, request.endpoint):
         return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
 
     data = request.get_json()
@@ -191,49 +845,206 @@ def create_short_url():
         return jsonify({"error": "Invalid request. 'longUrl' field is required"}), 400
     
     long_url = data['longUrl']
+    if not is_valid_url(long_url):
+        return jsonify({"error": "Invalid request. 'longUrl' is not a valid URL"}), 400
     
-    # Check Redis cache first
-    existing_short_id = redis_client.get(f"url:{long_url}")
-    if existing_short_id:
-        return jsonify({"shortUrl": f"https://tiny.url/{existing_short_id}"}), 200
+    if SHORT_ID_MODE == 'content_hash':
+        # Check Redis cache first
+        existing_short_id = storage.cache.get_short_id(long_url)
+        if existing_short_id:
+            return jsonify({"shortUrl": f"https://tiny.url/{existing_short_id}"}), 200
+
+        # Hash-derived ID: an existing mapping is found by primary key. Probes
+        # read the backend directly so the short ID filter can't hide a taken slot.
+        short_id, created = content_hash_strategy.resolve(storage.backend, long_url)
+        if not short_id:
+            return jsonify({"error": "Failed to create short URL"}), 500
+        short_id_filter.add(short_id)
+        storage.cache_mappings([(short_id, long_url)])
+        return jsonify({"shortUrl": f"https://tiny.url/{short_id}"}), 201 if created else 200
     
-    # Check database
+    # Check cache, then database
     existing_short_id = storage.url_exists(long_url)
     if existing_short_id:
-        # Update Redis cache
-        redis_client.setex(f"url:{long_url}", 3600, existing_short_id)
-        redis_client.setex(f"id:{existing_short_id}", 3600, long_url)
         return jsonify({"shortUrl": f"https://tiny.url/{existing_short_id}"}), 200
     
-    # Generate new short ID (implement your preferred method)
-    short_id = generate_short_id()  # You'll need to implement this
+    # Generate new short ID from the leased counter range
+    short_id = generate_short_id()
+    if not short_id:
+        return jsonify({"error": "No available short URLs"}), 500
     
-    # Store in database
+    # Store in database (and the cache, under write-through)
     if storage.store_url(short_id, long_url):
-        # Update Redis cache
-        redis_client.setex(f"url:{long_url}", 3600, short_id)
-        redis_client.setex(f"id:{short_id}", 3600, long_url)
         return jsonify({"shortUrl": f"https://tiny.url/{short_id}"}), 201
     
     return jsonify({"error": "Failed to create short URL"}), 500
 
+# Bulk shortening
+BATCH_MAX_URLS = int(os.getenv('BATCH_MAX_URLS', 10000))
+
+def shorten_urls(long_urls: List[str]) -> List[Tuple[Optional[str], bool]]:
+    """Batch version of create_short_url; (short_id, created) per URL, in input order.
+
+    URLs are deduped by normalized digest. Existing mappings are resolved with
+    one Redis MGET and one backend multi-get. New IDs are claimed as one block
+    and stored with one store_many; the storage wrapper caches them in a
+    single pipeline. short_id is None for URLs that could not be shortened.
+    """
+    unique_urls = {}
+    for long_url in long_urls:
+        unique_urls.setdefault(url_digest(long_url), long_url)
+    resolved: Dict[str, Tuple[Optional[str], bool]] = {}
+
+    if SHORT_ID_MODE == 'content_hash':
+        # Check Redis cache first
+        pending = []
+        for (digest, long_url), short_id in zip(unique_urls.items(),
+                                                storage.cache.get_short_ids(list(unique_urls.values()))):
+            if short_id:
+                resolved[digest] = (short_id, False)
+            else:
+                pending.append((digest, long_url))
+
+        # Existing mappings sit in the first probe slot unless it collided;
+        # probes read the backend directly, like ContentHashStrategy
+        candidates = [content_hash_id(normalize_url(long_url), 0) for _, long_url in pending]
+        to_store = []
+        to_cache = []
+        for (digest, long_url), short_id, existing in zip(pending, candidates, storage.backend.get_many(candidates)):
+            if existing is None:
+                to_store.append((digest, long_url, short_id))
+            elif ContentHashStrategy.same_url(existing, normalize_url(long_url)):
+                resolved[digest] = (short_id, False)
+                to_cache.append((short_id, long_url))
+            else:
+                resolved[digest] = content_hash_strategy.resolve(storage.backend, long_url)
+                to_cache.append((resolved[digest][0], long_url))
+    else:
+        # Check cache, then database
+        new_urls = []
+        for (digest, long_url), short_id in zip(unique_urls.items(),
+                                                storage.url_exists_many(list(unique_urls.values()))):
+            if short_id:
+                resolved[digest] = (short_id, False)
+            else:
+                new_urls.append((digest, long_url))
+        short_ids = id_generator.next_ids(len(new_urls))
+        to_store = [(digest, long_url, short_id) for (digest, long_url), short_id in zip(new_urls, short_ids)]
+        to_cache = []
+
+    # Store in database
+    if SHORT_ID_MODE == 'content_hash' and storage.store_many_overwrites:
+        # Hash slots must not be overwritten, so fall back to conditional single writes
+        stored = [storage.store_url(short_id, long_url) for _, long_url, short_id in to_store]
+    else:
+        stored = storage.store_many([(short_id, long_url) for _, long_url, short_id in to_store])
+    for (digest, long_url, short_id), ok in zip(to_store, stored):
+        if ok:
+            resolved[digest] = (short_id, True)
+        elif SHORT_ID_MODE == 'content_hash':
+            # Lost a race for the slot; probe the usual way
+            resolved[digest] = content_hash_strategy.resolve(storage.backend, long_url)
+            to_cache.append((resolved[digest][0], long_url))
+
+    # Mappings found around the wrapper go to Redis in one round trip
+    to_cache = [(short_id, long_url) for short_id, long_url in to_cache if short_id]
+    for short_id, _ in to_cache:
+        short_id_filter.add(short_id)
+    storage.cache_mappings(to_cache)
+
+    return [resolved.get(url_digest(long_url), (None, False)) for long_url in long_urls]
+
+def parse_batch_request() -> Optional[List[str]]:
+    """Read long URLs from a JSON array, {"longUrls": [...]}, or NDJSON lines."""
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            items = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        else:
+            items = request.get_json(silent=True)
+            if isinstance(items, dict):
+                items = items.get('longUrls')
+    except ValueError:
+        return None
+    if not isinstance(items, list):
+        return None
+    long_urls = []
+    for item in items:
+        long_url = item.get('longUrl') if isinstance(item, dict) else item
+        if not isinstance(long_url, str) or not long_url:
+            return None
+        long_urls.append(long_url)
+    return long_urls
+
+@app.route("/urls/batch", methods=["POST"])
+def create_short_urls_batch():
+    # Rate limiting check (one per batch)
+    client_ip = request.remote_addr
+    if is_rate_limited(client_ip, request.endpoint):
+        return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
+
+    long_urls = parse_batch_request()
+    if long_urls is None:
+        return jsonify({"error": "Invalid request. Expected a list of long URLs"}), 400
+    if len(long_urls) > BATCH_MAX_URLS:
+        return jsonify({"error": f"Batch too large. At most {BATCH_MAX_URLS} URLs per request"}), 413
+
+    # Unparseable URLs fail on their own instead of failing the whole batch
+    valid_urls = [long_url for long_url in long_urls if is_valid_url(long_url)]
+    shortened = dict(zip(valid_urls, shorten_urls(valid_urls)))
+
+    results = []
+    for long_url in long_urls:
+        short_id, created = shortened.get(long_url, (None, False))
+        if short_id:
+            results.append({"longUrl": long_url, "shortUrl": f"https://tiny.url/{short_id}", "created": created})
+        elif long_url not in shortened:
+            results.append({"longUrl": long_url, "error": "Invalid URL", "status": 400})
+        else:
+            results.append({"longUrl": long_url, "error": "Failed to create short URL", "status": 500})
+    return jsonify({"results": results}), 200
+
+def parse_resolve_request() -> Optional[List[str]]:
+    """Read short IDs from a JSON array or {"shortIds": [...]}."""
+    items = request.get_json(silent=True)
+    if isinstance(items, dict):
+        items = items.get('shortIds')
+    if not isinstance(items, list) or not all(isinstance(item, str) and item for item in items):
+        return None
+    return items
+
+@app.route("/urls/resolve", methods=["POST"])
+def resolve_short_urls_batch():
+    # Rate limiting check (one per batch)
+    client_ip = request.remote_addr
+    if is_rate_limited(client_ip, request.endpoint):
+        return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
+
+    short_ids = parse_resolve_request()
+    if short_ids is None:
+        return jsonify({"error": "Invalid request. Expected a list of short IDs"}), 400
+    if len(short_ids) > BATCH_MAX_URLS:
+        return jsonify({"error": f"Batch too large. At most {BATCH_MAX_URLS} IDs per request"}), 413
+
+    # One MGET, one backend multi-get for the misses, one backfill pipeline; not counted as clicks
+    long_urls = storage.get_many(short_ids)
+
+    results = []
+    for short_id, long_url in zip(short_ids, long_urls):
+        if long_url:
+            results.append({"shortId": short_id, "longUrl": long_url})
+        else:
+            results.append({"shortId": short_id, "error": "Short URL not found"})
+    return jsonify({"results": results}), 200
+
 @app.route("/urls/<short_id>", methods=["GET"])
 def redirect_to_long_url(short_id):
-    # Rate limiting check (keep existing code)
+    # Rate limiting check
     client_ip = request.remote_addr
-    if is_rate_limited(client_ip):
+    if is_rate_limited(client_ip, request.endpoint):
         return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
 
-    # Check Redis cache first
-    long_url = redis_client.get(f"id:{short_id}")
-    if not long_url:
-        # Check database
-        long_url = storage.get_url(short_id)
-        if long_url:
-            # Update Redis cache
-            redis_client.setex(f"id:{short_id}", 3600, long_url)
-            redis_client.setex(f"url:{long_url}", 3600, short_id)
-    
+    # Cache, then database; IDs the short ID filter rules out never reach the database
+    long_url = storage.get_url(short_id)
     if not long_url:
         return jsonify({"error": "Short URL not found"}), 404
     
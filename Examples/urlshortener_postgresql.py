@@ -1,6 +1,10 @@
 import psycopg2 # pip install psycopg2
+import io
 import random
 import string
+import time
+
+from urlshortener_pgpool import PGConnectionPool
 
 
 # CREATE TABLE urls (
@@ -8,6 +12,7 @@ import string
 #     short_url CHAR(7) UNIQUE NOT NULL,
 #     used BOOLEAN DEFAULT FALSE
 # );
+# CREATE INDEX urls_unused_idx ON urls (id) WHERE used = FALSE;
 
 
 # Database connection details
@@ -30,6 +35,15 @@ def connect_to_db():
         return None
 
 
+def create_connection_pool(min_size=1, max_size=10, checkout_timeout=5.0):
+    """Create a thread-safe connection pool for the key service.
+
+    Functions below take a single connection; borrow one from the pool with
+    `with pool.connection() as conn:` and don't hold it across requests.
+    """
+    return PGConnectionPool(min_size, max_size, checkout_timeout, **DB_CONFIG)
+
+
 def create_url_entry(conn, short_url, used=False):
     """Create a new URL entry."""
     try:
@@ -108,6 +122,64 @@ def generate_all_possible_keys(num_of_keys):
         print("Read URL entry:", url_entry)
 
 
+def bulk_generate_keys(conn, num_of_keys, batch_size=50000, bitmap=None):
+    """Seed the urls table with random keys using COPY in large batches.
+
+    Each batch is streamed into a temporary staging table with COPY and then
+    moved into urls with INSERT ... ON CONFLICT DO NOTHING, so duplicate keys
+    are skipped without aborting the batch. If a KeySpaceBitmap is given,
+    keys it already holds are skipped locally, and each batch's keys are
+    recorded in it once the batch has committed. Returns the number of keys
+    inserted.
+    """
+    inserted = 0
+    generated = 0
+    start = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS urls_staging (
+                    short_url CHAR(7)
+                ) ON COMMIT DELETE ROWS;
+            """)
+            while generated < num_of_keys:
+                count = min(batch_size, num_of_keys - generated)
+                batch = set()
+                for _ in range(count):
+                    short_url = generate_random_url()
+                    if bitmap is not None and short_url in bitmap:
+                        continue  # Already taken
+                    batch.add(short_url)
+                buf = io.StringIO("".join(f"{short_url}\n" for short_url in batch))
+
+                cur.copy_expert("COPY urls_staging (short_url) FROM STDIN", buf)
+                cur.execute("""
+                    INSERT INTO urls (short_url)
+                    SELECT DISTINCT short_url FROM urls_staging
+                    ON CONFLICT (short_url) DO NOTHING;
+                """)
+                batch_inserted = cur.rowcount
+                conn.commit()  # Also empties urls_staging
+                inserted += batch_inserted
+                generated += count
+                if bitmap is not None:
+                    # Only after the commit, so a failed batch leaves no bits behind.
+                    # Keys that hit ON CONFLICT were already in urls, so they are taken too.
+                    bitmap.update(batch)
+
+                elapsed = time.perf_counter() - start
+                print(f"Generated {generated}/{num_of_keys} keys, inserted {inserted} "
+                      f"({inserted / elapsed:,.0f} keys/s)")
+    except Exception as e:
+        conn.rollback()
+        print("Error bulk generating keys:", e)
+
+    elapsed = time.perf_counter() - start
+    print(f"Inserted {inserted} keys in {elapsed:.1f}s "
+          f"({generated - inserted} duplicates skipped)")
+    return inserted
+
+
 def create_urls_table(conn):
     """Create the urls table if it doesn't exist."""
     try:
@@ -120,17 +192,44 @@ def create_urls_table(conn):
                 );
             """
             cur.execute(query)
+            # Partial index over unused keys only, so claiming a key does not
+            # scan past used rows as the key space fills up
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS urls_unused_idx
+                ON urls (id) WHERE used = FALSE;
+            """)
             conn.commit()
             print("URLs table created successfully")
     except Exception as e:
         conn.rollback()
         print("Error creating URLs table:", e)
 
+def migrate_unused_key_index(conn):
+    """Add the unused-key partial index to an existing urls table.
+
+    The index is built CONCURRENTLY so the key service keeps running during
+    the migration, which requires autocommit mode.
+    """
+    autocommit = conn.autocommit
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS urls_unused_idx
+                ON urls (id) WHERE used = FALSE;
+            """)
+            cur.execute("ANALYZE urls;")
+        print("Unused key index created successfully")
+    except Exception as e:
+        print("Error creating unused key index:", e)
+    finally:
+        conn.autocommit = autocommit
+
 def get_unused_short_url(conn):
     """Get an unused short URL from the database."""
     try:
         with conn.cursor() as cur:
-            query = "SELECT short_url FROM urls WHERE used = FALSE LIMIT 1;"
+            query = "SELECT short_url FROM urls WHERE used = FALSE ORDER BY id LIMIT 1;"
             cur.execute(query)
             result = cur.fetchone()
             if result:
@@ -141,25 +240,56 @@ def get_unused_short_url(conn):
         return None
 
 def mark_url_used(conn, short_url):
-    """Mark a short URL as used."""
+    """Mark a short URL as used. Returns False if another caller claimed it first."""
     try:
         with conn.cursor() as cur:
-            query = "UPDATE urls SET used = TRUE WHERE short_url = %s;"
+            query = "UPDATE urls SET used = TRUE WHERE short_url = %s AND used = FALSE;"
             cur.execute(query, (short_url,))
             conn.commit()
-            return True
+            return cur.rowcount == 1
     except Exception as e:
         conn.rollback()
         print("Error marking URL as used:", e)
         return False
 
+def claim_key_block(conn, block_size):
+    """Atomically claim a block of unused short URLs and mark them used.
+
+    SKIP LOCKED lets concurrent workers claim disjoint blocks without
+    waiting on each other, so no key is ever handed out twice.
+    """
+    try:
+        with conn.cursor() as cur:
+            query = """
+                UPDATE urls
+                SET used = TRUE
+                WHERE id IN (
+                    SELECT id FROM urls
+                    WHERE used = FALSE
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING short_url;
+            """
+            cur.execute(query, (block_size,))
+            keys = [row[0].strip() for row in cur.fetchall()]  # Remove padding from CHAR(7)
+            conn.commit()
+            return keys
+    except Exception as e:
+        conn.rollback()
+        print("Error claiming key block:", e)
+        return []
+
 # Example usage
 if __name__ == "__main__":
-    conn = connect_to_db()
-    if conn:
+    pool = create_connection_pool()
+    with pool.connection() as conn:
         
         # create_urls_table(conn)
+        # migrate_unused_key_index(conn)
         # generate_all_possible_keys(100)
+        # bulk_generate_keys(conn, 1_000_000)
         
         # Create a random URL
         # short_url = generate_random_url()
@@ -181,5 +311,5 @@ if __name__ == "__main__":
         # rows_deleted = delete_url_entry(conn, short_url)
         # print(f"Deleted {rows_deleted} row(s).")
 
-        # Close connection
-        conn.close()
\ No newline at end of file
+        print("Pool stats:", pool.stats())
+    pool.close()
\ No newline at end of file
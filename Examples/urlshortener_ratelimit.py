@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class SlidingWindowRateLimiter:
+    """Sliding-window-counter rate limiter with fixed-size per-client state.
+
+    Each client keeps only (window_start, previous_count, current_count). The
+    request rate is estimated by weighting the previous window's count by how
+    much of it still overlaps the sliding window. Idle clients are evicted
+    least-recently-used once max_clients is reached. Timestamps come from the
+    monotonic clock, so wall-clock changes don't reset limits.
+    """
+
+    def __init__(self, limit: int, window: float, max_clients: int = 100000):
+        self.limit = limit
+        self.window = window
+        self.max_clients = max_clients
+        self._clients = OrderedDict()  # client -> [window_start, previous_count, current_count]
+        self._lock = threading.Lock()
+
+    def is_limited(self, client: str) -> bool:
+        """Count a request from client; True if it exceeds the limit (and is not counted)."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._clients.get(client)
+            if state is None:
+                state = [now, 0, 0]
+                self._clients[client] = state
+                if len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(client)
+                elapsed_windows = int((now - state[0]) // self.window)
+                if elapsed_windows:
+                    state[1] = state[2] if elapsed_windows == 1 else 0
+                    state[2] = 0
+                    state[0] += elapsed_windows * self.window
+
+            overlap = 1.0 - (now - state[0]) / self.window
+            if state[1] * overlap + state[2] >= self.limit:
+                return True
+            state[2] += 1
+            return False
+
+    def client_count(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+
+# Same sliding-window counter as SlidingWindowRateLimiter, kept in one Redis hash
+# per client. Time comes from the Redis server so all workers share one clock.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', key, 'start', 'prev', 'curr')
+local start = tonumber(state[1])
+local prev = tonumber(state[2]) or 0
+local curr = tonumber(state[3]) or 0
+if not start then
+    start = now
+else
+    local elapsed = math.floor((now - start) / window)
+    if elapsed >= 1 then
+        if elapsed == 1 then prev = curr else prev = 0 end
+        curr = 0
+        start = start + elapsed * window
+    end
+end
+if prev * (1 - (now - start) / window) + curr >= limit then
+    return 1
+end
+redis.call('HSET', key, 'start', start, 'prev', prev, 'curr', curr + 1)
+redis.call('PEXPIRE', key, window * 2)
+return 0
+"""
+
+
+class RedisRateLimiter:
+    """Sliding-window-counter limiter shared by every worker through Redis.
+
+    Each check is a single EVALSHA round trip that reads, rolls and updates
+    the client's counters atomically. Idle clients expire after two windows.
+    Works against a local Redis or an in-memory stand-in such as
+    fakeredis.FakeRedis (pip install "fakeredis[lua]"). If Redis is
+    unreachable, requests are allowed rather than rejected.
+    """
+
+    def __init__(self, redis_client, limit: int, window: float, key_prefix: str = "rate_limit:"):
+        self.limit = limit
+        self.window_ms = int(window * 1000)
+        self.key_prefix = key_prefix
+        self._script = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def is_limited(self, client: str) -> bool:
+        try:
+            return bool(self._script(keys=[f"{self.key_prefix}{client}"], args=[self.limit, self.window_ms]))
+        except Exception as e:
+            print("Error checking rate limit:", e)
+            return False
+
+
+def route_limits_from_env(env_vars: Dict[str, str], window: float) -> Dict[str, Tuple[int, float]]:
+    """Route limits for the routes whose env var (route -> var name) is set.
+
+    Routes left out share RouteRateLimiter's default limiter, so a client's
+    budget is not multiplied by the number of routes.
+    """
+    return {
+        route: (int(os.environ[env_var]), window)
+        for route, env_var in env_vars.items()
+        if os.getenv(env_var)
+    }
+
+
+class RouteRateLimiter:
+    """Per-route rate limits; routes without their own limit share the default.
+
+    Counters are kept in process unless a redis_client is given, in which
+    case every route uses a RedisRateLimiter shared by all workers.
+    """
+
+    def __init__(self, limit: int, window: float,
+                 route_limits: Optional[Dict[str, Tuple[int, float]]] = None,
+                 max_clients: int = 100000, redis_client=None):
+        self.max_clients = max_clients
+        self.redis_client = redis_client
+        self.default = self._make_limiter("default", limit, window)
+        self.routes = {
+            route: self._make_limiter(route, route_limit, route_window)
+            for route, (route_limit, route_window) in (route_limits or {}).items()
+        }
+
+    def _make_limiter(self, name: str, limit: int, window: float):
+        if self.redis_client is not None:
+            return RedisRateLimiter(self.redis_client, limit, window, key_prefix=f"rate_limit:{name}:")
+        return SlidingWindowRateLimiter(limit, window, self.max_clients)
+
+    def is_rate_limited(self, client: str, route: Optional[str] = None) -> bool:
+        return self.routes.get(route, self.default).is_limited(client)
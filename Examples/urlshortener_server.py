@@ -1,4 +1,5 @@
 from flask import Flask, request, jsonify   # pip install flask
+import os
 
 app = Flask(__name__)
 
@@ -15,49 +16,34 @@ def handle_post():
 # Store URL mappings in memory (in production, use a database)
 url_mappings = {}
 # Rate limiting configuration
-from datetime import datetime, timedelta
-from collections import defaultdict
-
-# Store request counts per IP with timestamps
-# Format: {ip_address: [(timestamp1, count1), (timestamp2, count2), ...]}
-request_history = defaultdict(list)
+from urlshortener_ratelimit import RouteRateLimiter, route_limits_from_env
 
 # Rate limit settings
 RATE_LIMIT = 10  # requests
 TIME_WINDOW = 60  # seconds
 
-def is_rate_limited(ip_address):
+# Sliding-window counters with fixed-size state per IP; idle IPs are evicted LRU.
+# Per-route limits are keyed by Flask endpoint name; without CREATE_RATE_LIMIT or
+# REDIRECT_RATE_LIMIT every route shares the default RATE_LIMIT budget.
+rate_limiter = RouteRateLimiter(
+    RATE_LIMIT,
+    TIME_WINDOW,
+    route_limits=route_limits_from_env({
+        "create_short_url": 'CREATE_RATE_LIMIT',
+        "redirect_to_long_url": 'REDIRECT_RATE_LIMIT'
+    }, TIME_WINDOW),
+    max_clients=int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 100000))
+)
+
+def is_rate_limited(ip_address, route=None):
     """Check if an IP address has exceeded the rate limit."""
-    now = datetime.now()
-    cutoff_time = now - timedelta(seconds=TIME_WINDOW)
-    
-    # Clean up old entries
-    request_history[ip_address] = [
-        (timestamp, count) for timestamp, count in request_history[ip_address] 
-        if timestamp > cutoff_time
-    ]
-    
-    # Calculate total requests in time window
-    total_requests = sum(count for _, count in request_history[ip_address])
-    
-    # Update request history
-    if request_history[ip_address]:
-        last_timestamp, count = request_history[ip_address][-1]
-        if last_timestamp.timestamp() // 1 == now.timestamp() // 1:
-            request_history[ip_address][-1] = (last_timestamp, count + 1)
-        else:
-            
-            request_history[ip_address].append((now, 1))
-    else:
-        request_history[ip_address].append((now, 1))
-    
-    return total_requests >= RATE_LIMIT
+    return rate_limiter.is_rate_limited(ip_address, route)
 
 @app.route("/urls", methods=["POST"])
 def create_short_url():
     # Check rate limit
     client_ip = request.remote_addr
-    if is_rate_limited(client_ip):
+    if is_rate_limited(client_ip, request.endpoint):
         return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
 
     data = request.get_json()
@@ -87,7 +73,7 @@ def create_short_url():
 def redirect_to_long_url(short_id):
     # Check rate limit
     client_ip = request.remote_addr
-    if is_rate_limited(client_ip):
+    if is_rate_limited(client_ip, request.endpoint):
         return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
 
     # Check if short URL ID exists in mappings
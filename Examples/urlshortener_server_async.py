@@ -0,0 +1,166 @@
+from quart import Quart, request, jsonify  # pip install quart
+import os
+from datetime import timedelta
+
+import asyncpg  # pip install asyncpg
+import redis.asyncio as aioredis  # pip install redis
+
+from urlshortener_cache import AsyncBackgroundRefresher, AsyncURLCache
+from urlshortener_clicks import AsyncClickAggregator
+from urlshortener_idgen import is_valid_url
+from urlshortener_async_storage import get_async_storage_backend
+from urlshortener_keypool import AsyncKeyPool
+from urlshortener_ratelimit import RouteRateLimiter, route_limits_from_env
+from urlshortener_singleflight import AsyncSingleFlight
+
+# asyncio-native variant of urlshortener_server_mongodb.py with the same
+# POST /urls and GET /urls/<short_id> contract. Redirects are counted in the
+# url_mappings clicks column/attribute, buffered and flushed in bulk.
+# Run with an ASGI server so one process keeps many requests in flight:
+#   hypercorn urlshortener_server_async:app --bind 0.0.0.0:8080
+
+app = Quart(__name__)
+
+BASE_URL = os.getenv('BASE_URL', 'http://localhost:8080/urls')
+CACHE_TTL = timedelta(days=7)
+# Spread expiries by +/- this fraction; refresh hot keys early (0 disables)
+CACHE_TTL_JITTER = float(os.getenv('CACHE_TTL_JITTER', 0.1))
+CACHE_EARLY_REFRESH_BETA = float(os.getenv('CACHE_EARLY_REFRESH_BETA', 1.0))
+
+# Rate limit settings
+RATE_LIMIT = 10  # requests
+TIME_WINDOW = 60  # seconds
+
+# In-memory state only, so no await is needed on the request path
+rate_limiter = RouteRateLimiter(
+    RATE_LIMIT,
+    TIME_WINDOW,
+    route_limits=route_limits_from_env({
+        "create_short_url": 'CREATE_RATE_LIMIT',
+        "redirect_to_long_url": 'REDIRECT_RATE_LIMIT'
+    }, TIME_WINDOW),
+    max_clients=int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 100000))
+)
+
+
+@app.before_serving
+async def startup():
+    # Connect to Redis
+    app.redis_client = aioredis.Redis(
+        host=os.getenv('REDIS_HOST', 'localhost'),
+        port=int(os.getenv('REDIS_PORT', 6379)),
+        decode_responses=True
+    )
+    app.url_cache = AsyncURLCache(app.redis_client, long_prefix="long_url:", short_prefix="short_url:", ttl=CACHE_TTL,
+                                  digest_long_keys=True, ttl_jitter=CACHE_TTL_JITTER)
+    if CACHE_EARLY_REFRESH_BETA > 0:
+        app.url_cache.refresher = AsyncBackgroundRefresher(load_long_url, beta=CACHE_EARLY_REFRESH_BETA)
+
+    # Connect to the URL storage backend (STORAGE_BACKEND=postgresql|mongodb|dynamodb)
+    app.storage = await get_async_storage_backend()
+
+    # Buffer clicks in memory and flush them as one bulk update per interval
+    app.click_aggregator = AsyncClickAggregator(
+        app.storage.increment_clicks_bulk,
+        flush_interval=float(os.getenv('CLICK_FLUSH_INTERVAL', 1.0)),
+        max_keys=int(os.getenv('CLICK_BUFFER_MAX_KEYS', 10000))
+    )
+
+    # Connect to the PostgreSQL key service
+    app.key_db = await asyncpg.create_pool(
+        database="mydb",
+        user="admin",
+        password="password",
+        host="localhost"
+    )
+    app.key_pool = AsyncKeyPool(
+        app.key_db,
+        block_size=int(os.getenv('KEY_BLOCK_SIZE', 1000)),
+        low_watermark=int(os.getenv('KEY_POOL_LOW_WATERMARK', 200))
+    )
+
+
+@app.after_serving
+async def shutdown():
+    await app.click_aggregator.close()
+    await app.storage.close()
+    await app.key_db.close()
+    await app.redis_client.aclose()
+
+
+@app.route("/urls", methods=["POST"])
+async def create_short_url():
+    # Check rate limit
+    if rate_limiter.is_rate_limited(request.remote_addr, request.endpoint):
+        return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
+
+    data = await request.get_json(silent=True)
+
+    # Validate request
+    if not data or 'longUrl' not in data:
+        return jsonify({"error": "Invalid request. 'longUrl' field is required"}), 400
+
+    long_url = data['longUrl']
+    if not is_valid_url(long_url):
+        return jsonify({"error": "Invalid request. 'longUrl' is not a valid URL"}), 400
+    url_cache = app.url_cache
+
+    # Check Redis cache first
+    cached_short_id = await url_cache.get_short_id(long_url)
+    if cached_short_id:
+        return jsonify({"shortUrl": f"{BASE_URL}/{cached_short_id}"}), 200
+
+    # Check if URL already exists in the backend
+    short_id = await app.storage.url_exists(long_url)
+    if short_id:
+        await url_cache.set_mapping(short_id, long_url)
+        return jsonify({"shortUrl": f"{BASE_URL}/{short_id}"}), 200
+
+    # Take a pre-claimed short URL from the key pool
+    short_id = await app.key_pool.get_key()
+    if not short_id:
+        return jsonify({"error": "No available short URLs"}), 500
+
+    if not await app.storage.store_url(short_id, long_url):
+        return jsonify({"error": "Failed to create short URL"}), 500
+
+    # Cache the new mapping
+    await url_cache.set_mapping(short_id, long_url)
+
+    return jsonify({"shortUrl": f"{BASE_URL}/{short_id}"}), 201
+
+
+# Coalesces concurrent cache-miss fetches of the same short ID
+url_loads = AsyncSingleFlight()
+
+async def load_long_url(short_id):
+    """Fetch a mapping from the backend and cache it; None if it doesn't exist."""
+    long_url = await app.storage.get_url(short_id)
+    if long_url:
+        await app.url_cache.set_mapping(short_id, long_url)
+    return long_url
+
+@app.route("/urls/<short_id>", methods=["GET"])
+async def redirect_to_long_url(short_id):
+    # Check rate limit
+    if rate_limiter.is_rate_limited(request.remote_addr, request.endpoint):
+        return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
+
+    url_cache = app.url_cache
+
+    # Check Redis cache first
+    long_url = await url_cache.get_long_url(short_id)
+    if not long_url:
+        # Concurrent misses share one backend fetch
+        long_url = await url_loads.do(short_id, lambda: load_long_url(short_id))
+        if not long_url:
+            return jsonify({"error": "Short URL not found"}), 404
+
+    # Count the click without waiting on the backend
+    app.click_aggregator.record(short_id)
+
+    return jsonify({"longUrl": long_url}), 301, {'Location': long_url}
+
+
+if __name__ == "__main__":
+    app.run(port=8080, debug=True)
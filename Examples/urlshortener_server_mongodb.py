@@ -16,16 +16,35 @@ def handle_post():
 
 # MongoDB configuration
 from pymongo import MongoClient
-from urlshortener_mongodb import create_url, get_url_by_id, increment_clicks
-from urlshortener_postgresql import get_unused_short_url, mark_url_used
-import psycopg2
+from urlshortener_mongodb import (
+    REDIRECT_PROJECTION, create_url, ensure_indexes, get_short_url_id, get_url_by_id, get_urls_by_ids,
+    increment_clicks_bulk, is_url_active, iter_short_url_ids, iter_top_clicked, seconds_until_expiry
+)
+from urlshortener_bloom import ShortIdFilter
+from urlshortener_clicks import ClickAggregator
+from urlshortener_keypool import KeyPool
+from urlshortener_idgen import PostgreSQLRangeSource, RangeLeasedIdGenerator, is_valid_url
+from urlshortener_cache import BackgroundRefresher, LocalCache, URLCache, resolve_many, warm_cache
+from urlshortener_singleflight import SingleFlight
+from urlshortener_postgresql import create_connection_pool
 import redis  # Add this import
+from datetime import datetime, timedelta
 
 # Connect to MongoDB
 client = MongoClient('mongodb://localhost:27017/')
 db = client.urlshortener
 url_mappings = db.url_mappings
 
+# Make sure the lookups below are index-backed (no-op if the indexes exist)
+ensure_indexes(db)
+
+# Buffer clicks in memory and flush them as one bulk_write per interval
+click_aggregator = ClickAggregator(
+    lambda deltas: increment_clicks_bulk(db, deltas),
+    flush_interval=float(os.getenv('CLICK_FLUSH_INTERVAL', 1.0)),
+    max_keys=int(os.getenv('CLICK_BUFFER_MAX_KEYS', 10000))
+)
+
 # Connect to Redis
 redis_client = redis.Redis(
     host='localhost',
@@ -33,6 +52,41 @@ redis_client = redis.Redis(
     decode_responses=True
 )
 
+# Filter of issued short IDs so unknown IDs get a 404 without a MongoDB query.
+# SHORT_ID_FILTER_BACKEND=redis (default) keeps it as one Redis bitmap shared by
+# every worker (~12 MB per 10M capacity), along with the negative cache. local
+# keeps both per process (~12 MB per 10M, twice that while rebuilding) and only
+# sees this process's new IDs, so use it with a single worker only. The filter
+# is rebuilt from the database every SHORT_ID_FILTER_REBUILD_INTERVAL seconds.
+short_id_filter = ShortIdFilter(
+    capacity=int(os.getenv('SHORT_ID_FILTER_CAPACITY', 10_000_000)),
+    error_rate=float(os.getenv('SHORT_ID_FILTER_ERROR_RATE', 0.01)),
+    negative_ttl=float(os.getenv('NEGATIVE_CACHE_TTL', 30)),
+    redis_client=redis_client if os.getenv('SHORT_ID_FILTER_BACKEND', 'redis') == 'redis' else None
+)
+short_id_filter.rebuild_in_background(lambda: iter_short_url_ids(db),
+                                      interval=float(os.getenv('SHORT_ID_FILTER_REBUILD_INTERVAL', 3600)))
+
+# In-process L1 cache in front of the Redis short ID lookups
+local_cache = LocalCache(
+    max_entries=int(os.getenv('L1_CACHE_MAX_ENTRIES', 10000)),
+    max_bytes=int(os.getenv('L1_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    ttl=float(os.getenv('L1_CACHE_TTL', 60))
+)
+# TTLs are spread by +/- CACHE_TTL_JITTER so entries cached in one burst don't expire together.
+# Reverse keys hold a digest of the normalized long URL, so they stay small however long the URL is
+CACHE_TTL = timedelta(days=7)
+CACHE_TTL_JITTER = float(os.getenv('CACHE_TTL_JITTER', 0.1))
+url_cache = URLCache(redis_client, long_prefix="long_url:", short_prefix="short_url:", ttl=CACHE_TTL, local_cache=local_cache,
+                     digest_long_keys=True, ttl_jitter=CACHE_TTL_JITTER)
+
+def cache_ttl_cap(url_mapping):
+    """max_ttl for caching url_mapping, so it leaves the cache when it expires; None if it outlives any entry."""
+    remaining = seconds_until_expiry(url_mapping)
+    if remaining is None or remaining > CACHE_TTL.total_seconds() * (1 + CACHE_TTL_JITTER):
+        return None
+    return remaining
+
 # Connect to PostgreSQL
 # conn = psycopg2.connect(
 #     dbname="urlshortener",
@@ -40,56 +94,64 @@ redis_client = redis.Redis(
 #     password="postgres",
 #     host="localhost"
 # )
-conn = psycopg2.connect(
-    dbname="mydb",
-    user="admin",
-    password="password",
-    host="localhost"
+# Request threads and the key pool refill share a bounded connection pool
+# to the key database (DB_CONFIG in urlshortener_postgresql.py)
+key_db_pool = create_connection_pool(
+    min_size=int(os.getenv('PG_POOL_MIN', 1)),
+    max_size=int(os.getenv('PG_POOL_MAX', 10)),
+    checkout_timeout=float(os.getenv('PG_POOL_TIMEOUT', 5))
 )
 
-# Rate limiting configuration
-from datetime import datetime, timedelta
-from collections import defaultdict
+# Short ID generation
+# SHORT_ID_MODE=keypool: lease unused keys from the PostgreSQL key table in blocks
+# SHORT_ID_MODE=counter: lease counter ranges and permute them into base62 IDs
+SHORT_ID_MODE = os.getenv('SHORT_ID_MODE', 'keypool')
+if SHORT_ID_MODE == 'counter':
+    id_generator = RangeLeasedIdGenerator(
+        PostgreSQLRangeSource(key_db_pool),
+        secret=os.getenv('SHORT_ID_SECRET', 'change-me'),
+        range_size=int(os.getenv('ID_RANGE_SIZE', 1000))
+    )
+    generate_short_id = id_generator.next_id
+else:
+    key_pool = KeyPool(
+        key_db_pool,
+        block_size=int(os.getenv('KEY_BLOCK_SIZE', 1000)),
+        low_watermark=int(os.getenv('KEY_POOL_LOW_WATERMARK', 200))
+    )
+    generate_short_id = key_pool.get_key
 
-# Store request counts per IP with timestamps
-# Format: {ip_address: [(timestamp1, count1), (timestamp2, count2), ...]}
-request_history = defaultdict(list)
+# Rate limiting configuration
+from urlshortener_ratelimit import RouteRateLimiter, route_limits_from_env
 
 # Rate limit settings
 RATE_LIMIT = 10  # requests
 TIME_WINDOW = 60  # seconds
 
-def is_rate_limited(ip_address):
+# Sliding-window counters with fixed-size state per IP; idle IPs are evicted LRU.
+# Per-route limits are keyed by Flask endpoint name; without CREATE_RATE_LIMIT or
+# REDIRECT_RATE_LIMIT every route shares the default RATE_LIMIT budget.
+# RATE_LIMIT_BACKEND=redis shares the counters across workers through Redis.
+rate_limiter = RouteRateLimiter(
+    RATE_LIMIT,
+    TIME_WINDOW,
+    route_limits=route_limits_from_env({
+        "create_short_url": 'CREATE_RATE_LIMIT',
+        "redirect_to_long_url": 'REDIRECT_RATE_LIMIT'
+    }, TIME_WINDOW),
+    max_clients=int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 100000)),
+    redis_client=redis_client if os.getenv('RATE_LIMIT_BACKEND', 'memory') == 'redis' else None
+)
+
+def is_rate_limited(ip_address, route=None):
     """Check if an IP address has exceeded the rate limit."""
-    now = datetime.now()
-    cutoff_time = now - timedelta(seconds=TIME_WINDOW)
-    
-    # Clean up old entries
-    request_history[ip_address] = [
-        (timestamp, count) for timestamp, count in request_history[ip_address] 
-        if timestamp > cutoff_time
-    ]
-    
-    # Calculate total requests in time window
-    total_requests = sum(count for _, count in request_history[ip_address])
-    
-    # Update request history
-    if request_history[ip_address]:
-        last_timestamp, count = request_history[ip_address][-1]
-        if last_timestamp.timestamp() // 1 == now.timestamp() // 1:
-            request_history[ip_address][-1] = (last_timestamp, count + 1)
-        else:
-            request_history[ip_address].append((now, 1))
-    else:
-        request_history[ip_address].append((now, 1))
-    
-    return total_requests >= RATE_LIMIT
+    return rate_limiter.is_rate_limited(ip_address, route)
 
 @app.route("/urls", methods=["POST"])
 def create_short_url():
     # Check rate limit
     client_ip = request.remote_addr
-    if is_rate_limited(client_ip):
+    if is_rate_limited(client_ip, request.endpoint):
         return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
 
     data = request.get_json()
@@ -99,35 +161,26 @@ def create_short_url():
         return jsonify({"error": "Invalid request. 'longUrl' field is required"}), 400
     
     long_url = data['longUrl']
+    if not is_valid_url(long_url):
+        return jsonify({"error": "Invalid request. 'longUrl' is not a valid URL"}), 400
     
     # Check Redis cache first
-    cached_short_id = redis_client.get(f"long_url:{long_url}")
+    cached_short_id = url_cache.get_short_id(long_url)
     if cached_short_id:
         short_id = str(cached_short_id)
         return jsonify({"shortUrl": f"{os.getenv('BASE_URL', 'http://localhost:8080/urls')}/{short_id}"}), 200
     
     # Check if URL already exists in MongoDB
-    existing_url = db.urls.find_one({"longUrl": long_url})
-    if existing_url:
-        short_id = existing_url['shortUrlId']
+    short_id = get_short_url_id(db, long_url)
+    if short_id:
         # Cache the mapping
-        redis_client.setex(
-            f"long_url:{long_url}", 
-            timedelta(days=7), 
-            short_id
-        )
-        redis_client.setex(
-            f"short_url:{short_id}", 
-            timedelta(days=7), 
-            long_url
-        )
+        url_cache.set_mapping(short_id, long_url)
         return jsonify({"shortUrl": f"{os.getenv('BASE_URL', 'http://localhost:8080/urls')}/{short_id}"}), 200
     
-    # Get unused short URL from PostgreSQL
-    short_id = get_unused_short_url(conn)
+    # Generate short ID locally (key pool or leased counter range)
+    short_id = generate_short_id()
     if not short_id:
         return jsonify({"error": "No available short URLs"}), 500
-    mark_url_used(conn, short_id)
     
     # Store URL in MongoDB
     create_url(
@@ -139,58 +192,161 @@ def create_short_url():
         tags=None,
         expire_date=datetime.now() + timedelta(days=365*5)  # URLs expire after 5 years
     )
+    short_id_filter.add(short_id)
     
     # Cache the new mapping
-    redis_client.setex(
-        f"long_url:{long_url}", 
-        timedelta(days=7), 
-        short_id
-    )
-    redis_client.setex(
-        f"short_url:{short_id}", 
-        timedelta(days=7), 
-        long_url
-    )
+    url_cache.set_mapping(short_id, long_url)
     
     short_url = f"{os.getenv('BASE_URL', 'http://localhost:8080/urls')}/{short_id}"
     return jsonify({"shortUrl": short_url}), 201
 
+# Coalesces concurrent cache-miss fetches of the same short ID
+url_loads = SingleFlight()
+
+def load_long_url(short_id):
+    """Fetch a mapping from MongoDB and cache it; None if it doesn't exist or is inactive.
+
+    Cached redirects are served without another MongoDB read, so an entry
+    never outlives metadata.expireDate, and an inactive link found here (on
+    a miss or a background refresh) is dropped from the cache. A link
+    deactivated in MongoDB is still served until its entry is refreshed or
+    expires; call url_cache.delete_mapping to take it down at once.
+    """
+    url_mapping = get_url_by_id(db, short_id, REDIRECT_PROJECTION)
+    if not url_mapping:
+        short_id_filter.record_miss(short_id)
+        return None
+    long_url = url_mapping['longUrl']
+    if not is_url_active(url_mapping):
+        url_cache.delete_mapping(short_id, long_url)
+        return None
+    url_cache.set_mapping(short_id, long_url, max_ttl=cache_ttl_cap(url_mapping))
+    return long_url
+
+# Hot keys are reloaded in the background shortly before they expire (0 disables)
+CACHE_EARLY_REFRESH_BETA = float(os.getenv('CACHE_EARLY_REFRESH_BETA', 1.0))
+if CACHE_EARLY_REFRESH_BETA > 0:
+    url_cache.refresher = BackgroundRefresher(load_long_url, beta=CACHE_EARLY_REFRESH_BETA)
+
+# Cache warm-up: before serving, load the most-clicked URLs (clicked in the
+# last CACHE_WARMUP_DAYS days) into Redis and the L1 cache
+CACHE_WARMUP_TOP_N = int(os.getenv('CACHE_WARMUP_TOP_N', 10000))  # 0 disables
+CACHE_WARMUP_DAYS = float(os.getenv('CACHE_WARMUP_DAYS', 7))
+CACHE_WARMUP_BUDGET = float(os.getenv('CACHE_WARMUP_BUDGET', 30))  # seconds
+CACHE_WARMUP_BATCH_SIZE = int(os.getenv('CACHE_WARMUP_BATCH_SIZE', 1000))
+
+def warm_up_cache():
+    """Stream the top clicked URLs from MongoDB into the cache within the warm-up budget."""
+    url_mappings = iter_top_clicked(
+        db,
+        CACHE_WARMUP_TOP_N,
+        REDIRECT_PROJECTION,
+        clicked_within=timedelta(days=CACHE_WARMUP_DAYS) if CACHE_WARMUP_DAYS else None,
+        batch_size=CACHE_WARMUP_BATCH_SIZE,
+        max_time=CACHE_WARMUP_BUDGET
+    )
+    try:
+        # Links expiring within the cache TTL are left to load_long_url, which caps their TTL
+        return warm_cache(
+            url_cache,
+            ((url_mapping['shortUrlId'], url_mapping['longUrl'])
+             for url_mapping in url_mappings
+             if is_url_active(url_mapping) and cache_ttl_cap(url_mapping) is None),
+            batch_size=CACHE_WARMUP_BATCH_SIZE,
+            budget=CACHE_WARMUP_BUDGET,
+            total=CACHE_WARMUP_TOP_N
+        )
+    except Exception as e:
+        print("Error warming cache:", e)
+        return 0
+
+if CACHE_WARMUP_TOP_N > 0:
+    warm_up_cache()
+
+# Bulk resolve
+BATCH_MAX_URLS = int(os.getenv('BATCH_MAX_URLS', 10000))
+
+def load_long_urls(short_ids):
+    """Batch MongoDB lookup for resolve_many; None for missing or inactive URLs.
+
+    Caches what it finds like load_long_url, with TTLs capped at expiry.
+    """
+    long_urls = []
+    uncapped = []
+    for short_id, url_mapping in zip(short_ids, get_urls_by_ids(db, short_ids, REDIRECT_PROJECTION)):
+        if not url_mapping or not is_url_active(url_mapping):
+            long_urls.append(None)
+            continue
+        long_url = url_mapping['longUrl']
+        long_urls.append(long_url)
+        max_ttl = cache_ttl_cap(url_mapping)
+        if max_ttl is None:
+            uncapped.append((short_id, long_url))
+        else:
+            url_cache.set_mapping(short_id, long_url, max_ttl=max_ttl)
+    url_cache.set_mappings(uncapped)
+    return long_urls
+
+def parse_resolve_request():
+    """Read short IDs from a JSON array or {"shortIds": [...]}."""
+    items = request.get_json(silent=True)
+    if isinstance(items, dict):
+        items = items.get('shortIds')
+    if not isinstance(items, list) or not all(isinstance(item, str) and item for item in items):
+        return None
+    return items
+
+@app.route("/urls/resolve", methods=["POST"])
+def resolve_short_urls_batch():
+    # Rate limiting check (one per batch)
+    client_ip = request.remote_addr
+    if is_rate_limited(client_ip, request.endpoint):
+        return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
+
+    short_ids = parse_resolve_request()
+    if short_ids is None:
+        return jsonify({"error": "Invalid request. Expected a list of short IDs"}), 400
+    if len(short_ids) > BATCH_MAX_URLS:
+        return jsonify({"error": f"Batch too large. At most {BATCH_MAX_URLS} IDs per request"}), 413
+
+    # One MGET, one backend multi-get for the misses, one backfill pipeline; not counted as clicks
+    long_urls = resolve_many(url_cache, short_ids, load_long_urls, short_id_filter, backfill=False)
+
+    results = []
+    for short_id, long_url in zip(short_ids, long_urls):
+        if long_url:
+            results.append({"shortId": short_id, "longUrl": long_url})
+        else:
+            results.append({"shortId": short_id, "error": "Short URL not found"})
+    return jsonify({"results": results}), 200
+
 @app.route("/urls/<short_id>", methods=["GET"])
 def redirect_to_long_url(short_id):
     # Check rate limit
     client_ip = request.remote_addr
-    if is_rate_limited(client_ip):
+    if is_rate_limited(client_ip, request.endpoint):
         return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
 
     # Check Redis cache first
-    cached_long_url = redis_client.get(f"short_url:{short_id}")
+    cached_long_url = url_cache.get_long_url(short_id)
     if cached_long_url:
         long_url = cached_long_url if isinstance(cached_long_url, str) else cached_long_url.decode('utf-8')
         # Increment click count asynchronously
-        increment_clicks(db, short_id)
+        click_aggregator.record(short_id)
         return jsonify({"longUrl": long_url}), 301, {'Location': long_url}
 
     print("short_id: ", short_id)
-    # Get URL from MongoDB if not in cache
-    url_mapping = get_url_by_id(db, short_id)
-    if not url_mapping:
+    # Definite miss: the ID was never issued or was just looked up and not found
+    if not short_id_filter.might_exist(short_id):
+        return jsonify({"error": "Short URL not found"}), 404
+
+    # Get URL from MongoDB if not in cache; concurrent misses share one fetch
+    long_url = url_loads.do(short_id, lambda: load_long_url(short_id))
+    if not long_url:
         return jsonify({"error": "Short URL not found"}), 404
-    
-    # Cache the mapping
-    long_url = url_mapping['longUrl']
-    redis_client.setex(
-        f"short_url:{short_id}", 
-        timedelta(days=7), 
-        long_url
-    )
-    redis_client.setex(
-        f"long_url:{long_url}", 
-        timedelta(days=7), 
-        short_id
-    )
 
-    # Increment click count
-    increment_clicks(db, short_id)
+    # Increment click count asynchronously
+    click_aggregator.record(short_id)
     
     print("long_url: ", long_url)
     